@@ -1,33 +1,26 @@
 # Script for create users in command line
 
-from biicode.server.store.mongo_store import MongoStore
-from biicode.server.store.mongo_server_store import MongoServerStore
-from biicode.server.conf import BII_MONGO_URI
+from biicode.server.store.store_factory import build_store
 from biicode.server.user.user_service import UserService
 import sys
 from biicode.common.model.brl.brl_user import BRLUser
 import getpass
 
 
-connection = MongoStore.makeConnection(BII_MONGO_URI)
-database_name = BII_MONGO_URI.split("/").pop()
-server_store = MongoServerStore(connection, database_name)
-
-
-def new_user(login, email, password):   
+def new_user(server_store, login, email, password):
     service = UserService(server_store, login)
     service.register(login, email, password, True)
     user = server_store.read_user(login)
     user.active = True
     server_store.update_user(user)
     
-def change_password(login, password):   
+def change_password(server_store, login, password):
     user = server_store.read_user(login)
     user.password = password
     server_store.update_user(user)
     
 
-def input_new_user():
+def input_new_user(server_store):
     print "\n--------new user---------\n"
     login = raw_input("Login: ")
     email = raw_input("Email: ")
@@ -36,10 +29,10 @@ def input_new_user():
     if password != password_confirm:
         print "Password doesn't match"
         return
-    new_user(login, email, password)
+    new_user(server_store, login, email, password)
     print "User created!"
     
-def input_change_password():
+def input_change_password(server_store):
     print "\n-------change password---------\n"
     login = raw_input("Login: ")
     password = getpass.getpass("New password: ")
@@ -47,12 +40,13 @@ def input_change_password():
     if password != password_confirm:
         print "Password doesn't match"
         return
-    change_password(login, password)
+    change_password(server_store, login, password)
     print "Password updated!"
         
     
 def main():
-    
+    # Same store as the server, with the memcache proxy, so the cached users are invalidated
+    server_store = build_store(process_caches=False)
     actions = {1: input_new_user, 2: input_change_password}
     
     while(1):
@@ -62,7 +56,7 @@ def main():
         print "--------------------"
         action = input("\nChoose action: ")
         try:    
-            actions[action]()
+            actions[action](server_store)
             return
         except KeyError:
             pass
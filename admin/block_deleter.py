@@ -12,6 +12,7 @@ def block_delete(brl_block, store):
         cell_ids, content_ids = block.all_ids()
         try:
             store.delete_published_cells(cell_ids)
+            store.delete_published_min_cells(cell_ids)
         except BiiException as e:
             logger.error("Unable to delete cells %s" % e)
         try:
@@ -19,6 +20,7 @@ def block_delete(brl_block, store):
         except BiiException as e:
             logger.error("Unable to delete contents %s" % e)
         store.delete_block(brl_block)
+        store.bump_block_change_counter(brl_block)
     except BiiException as e:
         logger.error("Unable to delete block or cells/contents %s" % e)
     # Deleting from user profile, should be the last thing
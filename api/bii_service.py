@@ -7,11 +7,13 @@ from biicode.common.exception import (ForbiddenException, NotFoundException, Not
 from biicode.common.model.server_info import ServerInfo
 from biicode.server.authorize import Security
 from biicode.server.find.finder_service import FindService
+from biicode.server.find.find_process_pool import get_find_process_pool
 from biicode.server.conf import (BII_LAST_COMPATIBLE_CLIENT)
 from biicode.server.store.mem_server_store import MemServerStore
 from biicode.common.diffmerge.compare import compare_remote_versions
 from biicode.server.user.user_service import UserService
 from biicode.common.model.symbolic.block_version import BlockVersion
+from biicode.server.model.block import Block
 from biicode.server.reference_translator.reference_translator_service import ReferenceTranslatorService
 
 
@@ -58,24 +60,23 @@ class BiiService(BiiAPI):
         """
         assert block_version.time is not None
         try:
-            # FIXME: Optimize, reading all block only for get last version
             self.security.check_read_block(block_version.block)
-            block = self._store.read_block(block_version.block)
             if block_version.time > -1:
-                return block.deltas[block_version.time]
+                delta = self._store.read_block_delta(block_version.block, block_version.time)
+                if delta is None:
+                    raise NotFoundException("Block version %s not found!" % str(block_version))
+                return delta
             else:
                 return None
         except NotInStoreException:
             raise NotFoundException("Block %s not found!" % block_version.block.to_pretty())
-        except IndexError:
-            raise NotFoundException("Block version %s not found!" % str(block_version))
 
     def get_version_by_tag(self, brl_block, version_tag):
         """Given a BlockVersion that has a tag but not a time returns a complete BlockVersion"""
         assert version_tag is not None
         try:
             self.security.check_read_block(brl_block)
-            block = self._store.read_block(brl_block)
+            block = self._store.read_block(brl_block, [Block.SERIAL_DELTAS])
             for time, delta in reversed(list(enumerate(block.deltas))):
                 if delta.versiontag == version_tag:
                     return BlockVersion(brl_block, time, version_tag)
@@ -105,7 +106,8 @@ class BiiService(BiiAPI):
 
         try:
             self.security.check_read_block(brl_block)  # Security first, always
-            block = self._store.read_block(brl_block)
+            block = self._store.read_block(brl_block, [Block.SERIAL_CELL_TABLE,
+                                                       Block.SERIAL_DELTAS])
 
             if block_version.time > len(block.deltas) - 1:
                 raise NotFoundException("There is no published version %d of %s\n" %
@@ -118,9 +120,12 @@ class BiiService(BiiAPI):
             raise NotFoundException("Block version %s not found!\n" % str(block_version))
 
     def find(self, finder_request, response):
-        ''' Find remote dependences '''
+        ''' Find remote dependences, in a worker process if configured '''
+        pool = get_find_process_pool()
+        if pool is not None:
+            return pool.find(self._auth_user, finder_request, response)
         store = MemServerStore(self._store)
-        f = FindService(store, self._auth_user)
+        f = FindService(store, self._auth_user, self._store.find_result_cache)
         return f.find(finder_request, response)
 
     def compute_diff(self, base_version, other_version):
@@ -144,7 +149,7 @@ class BiiService(BiiAPI):
         '''Gets 2 BlockVersion ([0],[1]) in a list and returns the renames'''
         security = Security(self._auth_user, self._store)
         security.check_read_block(brl_block)
-        block = self._store.read_block(brl_block)
+        block = self._store.read_block(brl_block, [Block.SERIAL_RENAMES])
         return block.get_renames(t1, t2)
 
     def require_auth(self):
@@ -147,6 +147,13 @@ class Security(object):
             if not self._read_granted(brl_block, block_access):
                 raise ForbiddenException("Permission denied: Reading block '%s'" % (brl_block))
 
+    def filter_read_blocks(self, brl_blocks):
+        '''Returns the set of brl_blocks that auth_user can read, reading all the permissions
+        at once. Not existing blocks are not readable'''
+        permissions = self._store.read_blocks_permissions(brl_blocks)
+        return {brl_block for brl_block, block_access in permissions.iteritems()
+                if not block_access.is_private or self._read_granted(brl_block, block_access)}
+
     def check_write_block(self, brl_block):
         try:
             block_access = self._store.read_block_permissions(brl_block)
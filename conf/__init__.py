@@ -1,4 +1,5 @@
 import os
+import ast
 from datetime import timedelta
 from biicode.common.model.server_info import ClientVersion
 from biicode.common.conf.configure_environment import get_env
@@ -13,6 +14,7 @@ BII_MEMCACHE_PASSWORD = get_env('MEMCACHIER_PASSWORD', None)  # Heroku need
 BII_MEMCACHE_BLOCK_PERMISSIONS_EXPIRE_MINUTES = timedelta(minutes=get_env('BII_MEMCACHE_BLOCK_PERMISSIONS_EXPIRE_MINUTES', 480))  # 8h
 BII_MEMCACHE_HIVE_PERMISSIONS_EXPIRE_MINUTES = timedelta(minutes=get_env('BII_MEMCACHE_HIVE_PERMISSIONS_EXPIRE_MINUTES', 60))  # 1h
 BII_MEMCACHE_SUBS_PERMISSIONS_EXPIRE_MINUTES = timedelta(minutes=get_env('BII_MEMCACHE_SUBS_PERMISSIONS_EXPIRE_MINUTES', 480))  # 8h
+BII_MEMCACHE_USER_EXPIRE_MINUTES = timedelta(minutes=get_env('BII_MEMCACHE_USER_EXPIRE_MINUTES', 60))  # 1h
 
 BII_DOS_ATTACK_MAX_REQUEST = get_env('BII_DOS_ATTACK_MAX_REQUEST', 10000)  # Max request in BII_DOS_ATTACK_DELTA_TIME
 BII_DOS_ATTACK_DELTA_TIME = timedelta(seconds=get_env('BII_DOS_ATTACK_DELTA_TIME', 10))  # Max request in 1 second
@@ -48,6 +50,21 @@ BII_GREET_MSG = get_env("BII_GREET_MSG", '')
 BII_LAST_COMPATIBLE_CLIENT = ClientVersion(get_env("BII_LAST_COMPATIBLE_CLIENT", '1.0'))
 
 BII_MAX_MONGO_POOL_SIZE = get_env("BII_MAX_MONGO_POOL_SIZE", 100)
+# Greenlets precomputing hypothesis closures: per find request, and for all the requests of
+# the process (so finds don't exhaust the Mongo pool). 1 disables the precomputation
+BII_FIND_MAX_CONCURRENT_CLOSURES = get_env("BII_FIND_MAX_CONCURRENT_CLOSURES", 8)
+BII_FIND_MAX_PROCESS_CONCURRENT_CLOSURES = get_env("BII_FIND_MAX_PROCESS_CONCURRENT_CLOSURES",
+                                                   max(1, BII_MAX_MONGO_POOL_SIZE / 2))
+# Find search limits: seconds and solver steps, 0 for no limit. When exceeded the best
+# partial solution is returned. BII_FIND_PLAN_LIMITS overrides them for the users of some
+# plans, as a python literal {plan_id: (seconds, steps)}. Without limits by default, finds
+# are exhaustive as before
+BII_FIND_MAX_SECONDS = get_env("BII_FIND_MAX_SECONDS", 0)
+BII_FIND_MAX_STEPS = get_env("BII_FIND_MAX_STEPS", 0)
+BII_FIND_PLAN_LIMITS = ast.literal_eval(get_env("BII_FIND_PLAN_LIMITS", "{}"))
+# Processes of each web worker running the finds, so the search doesn't stop its other
+# requests. 0 runs them in the request greenlet
+BII_FIND_PROCESSES = get_env("BII_FIND_PROCESSES", 0)
 
 BII_JWT_SECRET_KEY = get_env('BII_JWT_SECRET_KEY', 'fakejwtsecretjkey')
 BII_AUTH_TOKEN_EXPIRE_MINUTES = timedelta(minutes=get_env('BII_AUTH_TOKEN_EXPIRE_MINUTES', 30.0))
@@ -76,6 +93,38 @@ BII_GA_API_KEY = get_env('BII_GA_API_KEY', '')
 # in bytes
 BII_MAX_MEMORY_PER_REQUEST = get_env('BII_MAX_MEMORY_PER_REQUEST', MEGABYTE * 12)
 
+# in bytes, process local cache of read blocks. 0 disables it
+BII_BLOCK_CACHE_MAX_BYTES = get_env('BII_BLOCK_CACHE_MAX_BYTES', MEGABYTE * 64)
+
+# in bytes, process local cache of published cells and of published contents (each one).
+# 0 disables them
+BII_PUBLISHED_CACHE_MAX_BYTES = get_env('BII_PUBLISHED_CACHE_MAX_BYTES', MEGABYTE * 64)
+# in seconds, age of the elements of the process local tier of the published caches. Deletions
+# only purge the local tier of the deleting process, the others read them again when expired
+BII_PUBLISHED_CACHE_MAX_AGE = get_env('BII_PUBLISHED_CACHE_MAX_AGE', 300)
+
+# in bytes, process local cache of find immutable data (min cells, content sizes, dep tables).
+# 0 disables it
+BII_IMMUTABLE_CACHE_MAX_BYTES = get_env('BII_IMMUTABLE_CACHE_MAX_BYTES', MEGABYTE * 32)
+# in seconds, age of its min cells and content sizes. They are cached by ID, and the IDs of a
+# rolled back publication are used again. Dep tables and closures are validated by counters
+BII_IMMUTABLE_CACHE_IDS_MAX_AGE = get_env('BII_IMMUTABLE_CACHE_IDS_MAX_AGE', 300)
+
+# in bytes, process local cache of find results, validated with the block change counters.
+# 0 disables it
+BII_FIND_RESULT_CACHE_MAX_BYTES = get_env('BII_FIND_RESULT_CACHE_MAX_BYTES', MEGABYTE * 16)
+# in seconds, age of the cached find results. Permission changes don't change the counters,
+# a result can offer (or hide) blocks the user can't (or can) read for this time at most
+BII_FIND_RESULT_CACHE_MAX_AGE = get_env('BII_FIND_RESULT_CACHE_MAX_AGE', 300)
+
+# Elements of each class in the process table of interned names and versions
+BII_INTERN_MAX_SIZE = get_env('BII_INTERN_MAX_SIZE', 200000)
+
+# Versions with changes between the snapshot checkpoints of the cells and contents tables
+BII_SNAPSHOT_CHECKPOINT_VERSIONS = get_env('BII_SNAPSHOT_CHECKPOINT_VERSIONS', 16)
+# Checkpoints kept by each table, each one is a dict of all its names
+BII_SNAPSHOT_MAX_CHECKPOINTS = get_env('BII_SNAPSHOT_MAX_CHECKPOINTS', 4)
+
 # Enable BiiUserTraceBottlePlugin
 BII_ENABLED_BII_USER_TRACE = get_env('BII_ENABLED_BII_USER_TRACE', True)
 
@@ -1,4 +1,5 @@
 from biicode.common.model.symbolic.reference import References
+from itertools import ifilter
 
 
 class CompatibilityClosure(object):
@@ -10,6 +11,12 @@ class CompatibilityClosure(object):
         self.frontier = references or References()
         #Those references that were impossible to fetch, due to permissions or deletions
         self.broken = References()
+        #Those references already fetched (or broken) by the builds of this closure. Closures
+        #grow monotonically, later builds don't fetch them again
+        self.retrieved = References()
+        #Fetch statistics: references fetched and references reached again but not fetched
+        self.num_fetched = 0
+        self.num_reused = 0
 
     @property
     def references(self):
@@ -26,15 +33,24 @@ class CompatibilityClosure(object):
         return r
 
     def conflicts(self, other):
-        '''pairwise compatibility between closures'''
-        count = 0
-        for root_id, (ids, _, _) in self._elements.iteritems():
-            if root_id in other._elements:
-                ids_other, _, _ = other._elements[root_id]
-                # mapping must exist and values not equal for incompatibility
-                if ids != ids_other:
-                    count += 1
-        return count
+        '''pairwise compatibility between closures: number of common roots with different
+        (cell_id, content_id)'''
+        return sum(1 for _ in self._conflicting_roots(other))
+
+    def is_compatible(self, other):
+        '''same as conflicts(other) == 0, but stops at the first conflict'''
+        return next(self._conflicting_roots(other), None) is None
+
+    def _conflicting_roots(self, other):
+        '''Only the roots of the smaller closure are probed in the bigger one, closures
+        of different sizes share few roots'''
+        small, big = self._elements, other._elements
+        if len(small) > len(big):
+            small, big = big, small
+        for root_id in ifilter(big.__contains__, small):
+            # mapping must exist and values not equal for incompatibility
+            if small[root_id][0] != big[root_id][0]:
+                yield root_id
 
     def add_item(self, ids, root_id, block_version, name):
         #old_item = self._elements.get(root_id)
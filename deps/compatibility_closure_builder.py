@@ -3,20 +3,33 @@ from biicode.common.model.symbolic.reference import References
 from biicode.common.model.symbolic.block_version_table import BlockVersionTable
 
 
-def _compute_frontier(missing_dict, restricted_versions, full_graph, retrieved, open_frontier):
+def _compute_frontier(missing_dict, restricted_versions, full_graph, retrieved, open_frontier,
+                      neighbour_tables):
+    """ returns the references of missing_dict to fetch in restricted_versions, not retrieved
+    yet, and the number of those already retrieved. Others are added to open_frontier.
+    neighbour_tables: {block_version: BlockVersionTable of its neighbours}, filled on demand
+    """
     frontier = References()
+    reused = 0
     for block_version, targets in missing_dict.iteritems():
-        neighbours = BlockVersionTable(full_graph.neighbours(block_version))
+        neighbours = None
         for target in targets:
             if target.block_name != block_version.block_name:
+                if neighbours is None:
+                    neighbours = neighbour_tables.get(block_version)
+                    if neighbours is None:
+                        neighbours = BlockVersionTable(full_graph.neighbours(block_version))
+                        neighbour_tables[block_version] = neighbours
                 other_version = neighbours.get(target.block_name)
-                if other_version not in restricted_versions:
-                    open_frontier[other_version].add(target.cell_name)
             else:
                 other_version = block_version
-            if other_version in restricted_versions and target.cell_name not in retrieved[other_version]:
+            if target.cell_name in retrieved.get(other_version, ()):
+                reused += 1
+            elif other_version in restricted_versions:
                 frontier[other_version].add(target.cell_name)
-    return frontier
+            else:
+                open_frontier[other_version].add(target.cell_name)
+    return frontier, reused
 
 
 def build_compatibility_closure(api, closure, restricted_versions, full_graph):
@@ -28,16 +41,21 @@ def build_compatibility_closure(api, closure, restricted_versions, full_graph):
                 MUST implement get_dep_table and get_published_min_refs
             references: missing references to fetch and add to closure
     """
-    retrieved = References()  # Accumulates all references retrieved
+    retrieved = closure.retrieved  # Accumulates all references retrieved, by all the builds
+    neighbour_tables = {}  # Of the versions in full_graph, each one built once
 
     # define the frontier to be taken into account to expand, and update it removing those elements
     frontier = References()
     for version, cell_names in closure.frontier.items():
         if version in restricted_versions:
-            frontier[version] = cell_names
+            new_names = cell_names.difference(retrieved.get(version, ()))
+            closure.num_reused += len(cell_names) - len(new_names)
+            if new_names:
+                frontier[version] = new_names
             del closure.frontier[version]
 
     while frontier:
+        closure.num_fetched += sum(len(names) for names in frontier.itervalues())
         #logger.debug("Missing to fetch: %s" % str(references))
         min_cells = api.get_published_min_refs(frontier)
         # min_cells are {block_version: {cell_name: ((cell_id, content_id), root_id, deps)}
@@ -57,7 +75,9 @@ def build_compatibility_closure(api, closure, restricted_versions, full_graph):
             broken_names = names.difference(min_cells.get(version, []))
             if broken_names:
                 closure.broken[version].update(broken_names)
+                retrieved[version].update(broken_names)
 
         # now, the references are the new ones
-        frontier = _compute_frontier(missing_dict, restricted_versions, full_graph, retrieved,
-                                     closure.frontier)
+        frontier, reused = _compute_frontier(missing_dict, restricted_versions, full_graph,
+                                             retrieved, closure.frontier, neighbour_tables)
+        closure.num_reused += reused
@@ -33,6 +33,25 @@ class MongoUpsertException(MongoUpdateException):
     pass
 
 
+class MongoBulkUpdateException(MongoUpdateException):
+    '''Some values of an update_multi were not written, all the others were'''
+
+    def __init__(self, message, not_current_ids=None, not_found_ids=None):
+        MongoUpdateException.__init__(self, message)
+        self.not_current_ids = not_current_ids or []
+        self.not_found_ids = not_found_ids or []
+
+
+class MongoBulkNotCurrentException(MongoBulkUpdateException, MongoNotCurrentObjectException):
+    '''Some values of an update_multi were not current, as update it can be retried'''
+    pass
+
+
+class MongoBulkNotFoundException(MongoBulkUpdateException, MongoNotFoundUpdatingException):
+    '''Some values of an update_multi were not found, all of them were current'''
+    pass
+
+
 class DuplicateBlockException(BiiException):
     pass
 
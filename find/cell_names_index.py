@@ -0,0 +1,42 @@
+import posixpath
+from collections import defaultdict
+from biicode.common.model.declare.cpp_declaration import CPPDeclaration
+from biicode.server.utils.intern import names
+
+
+class CellNamesIndex(object):
+    '''BlockCellNames of a block version, plus the old names of its renamed cells as aliases
+    of the current ones, indexed by basename. C/C++ includes can only match files with the
+    same basename, so they are matched against those cells only. Other declarations are
+    matched against all the names'''
+
+    def __init__(self, block_name, cell_names, renames=None):
+        '''
+        Params:
+            block_name: BlockName
+            cell_names: CellNames of the version
+            renames: {old CellName: current CellName} or None
+        '''
+        self._current = {}  # {BlockCellName: current BlockCellName}
+        for cell_name in cell_names:
+            name = names.intern(block_name + cell_name)
+            self._current[name] = name
+        for old_name, new_name in (renames or {}).iteritems():
+            self._current.setdefault(names.intern(block_name + old_name),
+                                     names.intern(block_name + new_name))
+        self._names = self._current.keys()
+        self._by_basename = defaultdict(list)
+        for name in self._names:
+            self._by_basename[posixpath.basename(name)].append(name)
+
+    def match(self, declaration):
+        '''set(BlockCellName) matched by declaration, with renames applied, so they are
+        current names of the version'''
+        if isinstance(declaration, CPPDeclaration):
+            include = declaration.name.replace('\\', '/')
+            candidates = self._by_basename.get(posixpath.basename(include), [])
+        else:
+            candidates = self._names
+        if not candidates:
+            return set()
+        return {self._current[name] for name in declaration.match(candidates)}
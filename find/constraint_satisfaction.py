@@ -1,13 +1,17 @@
 from biicode.common.utils.bii_logging import logger
-import copy
+import time
 
 
-class History:
-    def __init__(self, elem=None, var=-1, nVal=-1, depth=-1):
-        self.elem = elem
-        self.var = var
-        self.nVal = nVal
-        self.depth = depth
+def _bits(mask):
+    '''indexes of the bits set in mask, lowest first'''
+    while mask:
+        bit = mask & -mask
+        yield bit.bit_length() - 1
+        mask ^= bit
+
+
+def _count_bits(mask):
+    return bin(mask).count("1")
 
 
 class BaseCSPElem(object):
@@ -15,15 +19,46 @@ class BaseCSPElem(object):
         raise NotImplementedError
 
 
+class SearchBudget(object):
+    '''Limits of a search, shared by all its solvers: a deadline in seconds from its creation
+    and a number of steps. None for no limit'''
+    TIME = "time"
+    STEPS = "steps"
+
+    def __init__(self, max_seconds=None, max_steps=None):
+        self.deadline = time.time() + max_seconds if max_seconds is not None else None
+        self.max_steps = max_steps
+        self.steps = 0
+        self.exhausted = None  # TIME or STEPS once exceeded
+
+    def spend(self):
+        '''counts one step, returns False if the budget is exhausted'''
+        self.steps += 1
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.exhausted = SearchBudget.STEPS
+        elif self.deadline is not None and time.time() > self.deadline:
+            self.exhausted = SearchBudget.TIME
+        return self.exhausted is None
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
 class IterDeep(object):
     '''driver for iterative deepening search
        starts with first version for each hypothesis
-       by default and iteratively adds one version'''
+       by default and iteratively adds one version.
+       Incremental: all the iterations share a CompatibilityMatrix, and as the previous
+       iteration proved there is no solution with the old values, each iteration skips
+       the branches that can only assign old values. The search order is the one of a
+       full search, so the solution is the same.
+       With a SearchBudget, when exceeded returns the best partial solution found'''
 
     END_ITER = -1
     NEXT_ITER = 0
 
-    def __init__(self, csp, init_bounds=None, root_hyp=None):
+    def __init__(self, csp, init_bounds=None, root_hyp=None, budget=None):
         if init_bounds:
             self.__bounds = init_bounds
         else:
@@ -37,6 +72,9 @@ class IterDeep(object):
         self.__solSet = []
         self.__isSolFound = False
         self.__numIter = 1
+        self.__matrix = None
+        self.__budget = budget
+        self.__best_partial = None
 
     @property
     def init_bounds(self):
@@ -54,6 +92,11 @@ class IterDeep(object):
     def num_iter(self):
         return self.__numIter
 
+    @property
+    def budget_exhausted(self):
+        '''SearchBudget.TIME or STEPS if the search was stopped by its budget, else None'''
+        return self.__budget.exhausted if self.__budget is not None else None
+
     @property
     def csp_cur(self):
         return self.__csp_cur
@@ -73,7 +116,8 @@ class IterDeep(object):
             return True
 
     def start(self):
-        ''' driver: returns True / [hypothesis sol] or False / None'''
+        ''' driver: returns True / [hypothesis sol] or False / None.
+        If the budget is exhausted False / [hypothesis of the best partial sol] (or None)'''
         # check for root hyp consistency
         if self.__root_hyp:
             if not self.__is_root_hyp_consistent():
@@ -84,23 +128,46 @@ class IterDeep(object):
         self.__solSet = []
         self.__isSolFound = False
         self.__init_csp()
-        csp = CSPExact(self.__csp_cur, self.__root_hyp)
+        # Rows grow in place, so the matrix positions are valid for all the iterations
+        self.__matrix = CompatibilityMatrix(self.__csp_cur)
+        self.__best_partial = None
+        csp = CSPExact(self.__csp_cur, self.__root_hyp, self.__matrix, budget=self.__budget)
         #logger.debug(IterDeep.print_in_matrix_form(self.csp_cur))
-        csp.solveCSP()
-        while(not csp.isSolFound):
+        self.__solve(csp)
+        while(not csp.isSolFound and not self.budget_exhausted):
+            old_sizes = [len(row) for row in self.__csp_cur]
             if self.next_csp() == self.END_ITER:
                 break
-            csp = CSPExact(self.__csp_cur, self.__root_hyp)
-            csp.solveCSP()
+            csp = self.__solve_new_values(old_sizes)
             self.__numIter += 1
 
         self.__isSolFound = csp.isSolFound
         if self.__isSolFound:
             self.__solSet = csp.getCompatibleSol()
             return  self.__isSolFound, self.__solSet
+        elif self.budget_exhausted:
+            logger.info("Search budget exhausted (%s) in iter %d"
+                        % (self.budget_exhausted, self.__numIter))
+            return  self.__isSolFound, self.__best_partial
         else:
             return  self.__isSolFound, None
 
+    def __solve(self, csp):
+        '''solves csp keeping the best partial solution of all the solvers'''
+        if not csp.solveCSP():
+            partial = csp.getBestPartialSol()
+            if partial and len(partial) > len(self.__best_partial or []):
+                self.__best_partial = partial
+        return csp.isSolFound
+
+    def __solve_new_values(self, old_sizes):
+        '''searches the assignments with at least one value added by next_csp'''
+        old = [(1 << size) - 1 for size in old_sizes]
+        csp = CSPExact(self.__csp_cur, self.__root_hyp, self.__matrix, budget=self.__budget,
+                       old_domains=old)
+        self.__solve(csp)
+        return csp
+
     def __init_csp(self):
         'builds root csp'
         for i, row in enumerate(self.__csp_ref):
@@ -133,16 +200,67 @@ class IterDeep(object):
         return ret_str
 
 
+class CompatibilityMatrix(object):
+    '''Memo of pairwise compatibility of the elements of a csp (list of rows), so
+    is_compatible is computed once for each pair. Compatibility is symmetric.
+    For each element (var, index) and other variable, keeps two bitsets of the other
+    variable values: the already computed ones and the compatible ones'''
+
+    def __init__(self, csp):
+        self.csp = csp
+        self._known = {}  # {(var, index): [bitset per var]}
+        self._compatible = {}
+        self.num_checks = 0  # is_compatible calls
+
+    def _masks(self, var, index):
+        key = (var, index)
+        try:
+            return self._known[key], self._compatible[key]
+        except KeyError:
+            known = self._known[key] = [0] * len(self.csp)
+            compatible = self._compatible[key] = [0] * len(self.csp)
+            return known, compatible
+
+    def compatible(self, var, index, other, domain):
+        '''bitset of the values of "other" variable in domain bitset compatible with element
+        (var, index)'''
+        known, compatible = self._masks(var, index)
+        unknown = domain & ~known[other]
+        if unknown:
+            elem = self.csp[var][index]
+            row = self.csp[other]
+            for other_index in _bits(unknown):
+                self.num_checks += 1
+                other_known, other_compatible = self._masks(other, other_index)
+                bit = 1 << other_index
+                if row[other_index].is_compatible(elem):
+                    compatible[other] |= bit
+                    other_compatible[var] |= 1 << index
+                known[other] |= bit
+                other_known[var] |= 1 << index
+        return compatible[other] & domain
+
+
 class CSPExact:
+    '''Exact backtracking solver. Domains of the variables (rows) are bitsets of the
+    indexes of their not filtered values, filtered with forward checking (and optionally
+    arc consistency) against a CompatibilityMatrix'''
     MAX_NUM_SOL = 5
     LEAF_NODE = -1
 
-    def __init__(self, csp_hyp, root_hyp):
-        self.__csp = copy.copy(csp_hyp)
+    def __init__(self, csp_hyp, root_hyp, matrix=None, budget=None, old_domains=None):
+        '''matrix: CompatibilityMatrix of csp_hyp, or of a csp with the same elements in the
+        same positions (IterDeep), so it can be shared by several solvers
+        old_domains: optional bitset for each variable of already searched values, there is
+        no solution with only these values. Branches that can only assign them are pruned
+        budget: optional SearchBudget, each step spends one. When exhausted the search stops
+        without solution, keeping the best partial one'''
+        self.__csp = csp_hyp
         if root_hyp:
             self.__root_hyp = root_hyp
         else:
             self.__root_hyp = None
+        self.__matrix = matrix if matrix is not None else CompatibilityMatrix(self.__csp)
         self.__nVAR = len(self.__csp)
         self.__nVAL = max(map(len, self.__csp))   # Maximum size of any row
         self.__nSteps = 0
@@ -152,7 +270,9 @@ class CSPExact:
         self.__solSet = None                  # If compatible just one solution
         self.__arcConsistencyCheckOn = False
         self.__pathdict = None               # Path implemented as dic
-        self.__history = None
+        self.__domains = None                # Initial bitset of values of each variable
+        self.__old_domains = old_domains
+        self.__budget = budget
 
     def __repr__(self):
         ret_str = ''
@@ -169,19 +289,15 @@ class CSPExact:
         return ret_str
 
     def print_info(self):
-        ret_str = '\n steps:{0} prop:{1} depth_max:{2} NVAR:{3}\n'.format(
+        ret_str = '\n steps:{0} prop:{1} depth_max:{2} NVAR:{3} checks:{4}\n'.format(
                     self.__nSteps, self.__nPropagations,  self.__depth_max,
-                    self.__nVAR)
+                    self.__nVAR, self.__matrix.num_checks)
         return ret_str
 
     @property
     def nVar(self):
         return self.__nVAR
 
-    @nVar.getter
-    def nVar(self):
-        return self.__nVAR
-
     @property
     def arcConsistencyCheckOn(self):
         return self.__arcConsistencyCheckOn
@@ -194,46 +310,49 @@ class CSPExact:
     def isSolFound(self):
         return self.__isSolFound
 
-    @isSolFound.getter
-    def isSolFound(self):
-        return self.__isSolFound
-
     @property
     def nSteps(self):
         return self.__nSteps
 
-    @nSteps.getter
-    def nSteps(self):
-        return self.__nSteps
+    @property
+    def matrix(self):
+        return self.__matrix
 
     def getCompatibleSol(self):
         '''returns compatible list of hypothesis or None'''
         l = None
         if self.__isSolFound:
             l = []
-            for t in self.__solSet[0]:
-                x, y = t
+            for x, y in sorted(self.__solSet[0]):
                 l.append(self.__csp[x][y])
         return l
 
-    def __sizeList(self):
-        '''list of sizes for each hypothesis. probably remove'''
-        return max(map(len, self.__csp))
+    def getBestPartialSol(self):
+        '''returns the list of hypothesis (compatible between them) of the deepest partial
+        assignment found, or None'''
+        l = None
+        if self.__solSet and self.__solSet[0]:
+            l = []
+            for x, y in sorted(self.__solSet[0]):
+                l.append(self.__csp[x][y])
+        return l
 
     def __initSearch(self):
         '''sets initial variable for the search;
            must be called after constructor'''
-        if self.__nVAR == None or self.__csp == None:
-            logger.error('invalid CSPExact')
-            return -1        # possibly raise exception?
-        else:
-            self.__pathdict = {}
-            self.__nSteps = 0
-            self.__nPropagations = 0
-            self.__depth_max = -1
-            self.__isSolFound = False
-            self.__solSet = []
-            self.__history = []
+        self.__pathdict = {}
+        self.__nSteps = 0
+        self.__nPropagations = 0
+        self.__depth_max = -1
+        self.__isSolFound = False
+        self.__solSet = []
+        self.__domains = []
+        for row in self.__csp:
+            domain = 0
+            for index, elem in enumerate(row or []):
+                if elem is not None:
+                    domain |= 1 << index
+            self.__domains.append(domain)
 
     def preproc(self):
         '''propagates root_hyp: filters CSP elements
@@ -245,31 +364,11 @@ class CSPExact:
                 self.__isSolFound = False
                 return
             for var in range(self.__nVAR):
-                for val, elem in enumerate(self.__csp[var]):
-                    if not elem.is_compatible(hyp):
-                        self.__csp[var][val] = None
-
-    def __propagate(self, var, depth, elemOut):
-        '''filters a CSPExact variable and stores changes in history.
-           Assumes variable nVar is unlabeled'''
-        row = self.__csp[var]
-        for i, elem in enumerate(row):
-            if elem:
-                if not elem.is_compatible(elemOut):
-                    self.__nPropagations += 1
-                    self.__history.append(History(elem, var, i, depth))
-                    row[i] = None
-
-    def __numberOfValues(self, var):
-        '''number of non filtered values for variable nVar,
-           assumed unlabeled'''
-        nVal = 0
-        for elem in self.__csp[var]:
-            if elem != None:
-                nVal += 1
-        return nVal
-
-    def __selectVar(self, depth):
+                for val in _bits(self.__domains[var]):
+                    if not self.__csp[var][val].is_compatible(hyp):
+                        self.__domains[var] &= ~(1 << val)
+
+    def __selectVar(self, domains, labeled):
         '''Decision heuristic for next variable assignment: most restricted
            (minimum number of values: ties broken first found)
            Prunes the search space if no candidate values are available for
@@ -278,28 +377,25 @@ class CSPExact:
         retVar = 0
         minVal = self.__nVAL + 1
         for var in range(self.__nVAR):
-            if not self.__isVarLabeled(var, depth):
-                nVal = self.__numberOfValues(var)
+            if not labeled & (1 << var):
+                nVal = _count_bits(domains[var])
                 if nVal == 0:                 # PRUNE check no candidates
-                    retVar = CSPExact.LEAF_NODE
-                    break
+                    return CSPExact.LEAF_NODE
                 elif nVal < minVal:
                     minVal = nVal
                     retVar = var
         return retVar
 
-    def __isVarLabeled(self, var, depth):
-        '''Determines in current step if a variable is labeled.
-           NOTE: Does not detect labeling in the current step'''
-        if var in self.__pathdict:
-            return True
-
     def solveCSP(self):
         '''search driver: returns TRUE is joint compatibility found'''
         self.__initSearch()
         if self.__root_hyp:
             self.preproc()
-        self.__isSolFound = self.__expand(0)
+        try:
+            self.__isSolFound = self.__expand(self.__domains, 0, 0)
+        except BudgetExhausted:
+            self.__storeSol(len(self.__pathdict))  # The current path is consistent
+            self.__isSolFound = False
 
         # Basic check of solution length
         if self.__isSolFound:
@@ -307,8 +403,10 @@ class CSPExact:
                 logger.error('Error in CSPExact: incorrect solution')
         return self.__isSolFound
 
-    def __expand(self, depth):
-        '''recursive search function driver'''
+    def __expand(self, domains, labeled, depth, some_new=False):
+        '''recursive search function driver. domains are not modified, each level works with
+        its own filtered copy, so backtracking doesn't need to undo anything.
+        some_new: some labeled value is not in old_domains'''
         self.__nSteps += 1
 
         # Early solution check
@@ -316,57 +414,89 @@ class CSPExact:
             self.__storeSol(depth)
             return True
 
-        if self.__arcConsistencyCheckOn:
-            # ArcConsistencyCheck, not implemented
-            pass
+        if not some_new and self.__only_old(domains, labeled):
+            return False                # Already searched
+
+
+        if self.__budget is not None and not self.__budget.spend():
+            raise BudgetExhausted()
 
         # Select variable
-        nVarSel = self.__selectVar(depth)
+        nVarSel = self.__selectVar(domains, labeled)
         if nVarSel == CSPExact.LEAF_NODE:
             self.__storeSol(depth)
             return False                # Backtrack
 
-        # Select value
-        valCandidates = self.__csp[nVarSel]
-        for index, elem in enumerate(valCandidates):
-            if elem:                 # Decision heuristic, first non null
-                if elem.invalid:
-                    self.__csp[nVarSel] = None
-                    continue
-                else:
-                    self.__pathdict[nVarSel] = index
-                    self.__update(depth, elem)
-                    if self.__expand(depth + 1) == True:
-                        return True                    # Solution found
-                    else:
-                        self.__unupdate(depth)
-                        del self.__pathdict[nVarSel]
-        else:
-            return False     # Chronological backtracking
-
-    def __update(self, depth, elem):
-        '''Bulk propagation operation over unlabeled variables'''
+        # Select value, decision heuristic: first one
+        labeled |= 1 << nVarSel
+        row = self.__csp[nVarSel]
+        for index in _bits(domains[nVarSel]):
+            if row[index].invalid:
+                continue
+            new_domains = self.__propagate(domains, labeled, nVarSel, index)
+            if new_domains is not None and self.__arcConsistencyCheckOn:
+                new_domains = self.__arcConsistent(new_domains, labeled)
+            self.__pathdict[nVarSel] = index
+            if new_domains is None:    # Some variable without candidates
+                self.__storeSol(depth + 1)
+            elif self.__expand(new_domains, labeled, depth + 1,
+                               some_new or self.__is_new(nVarSel, index)):
+                return True                    # Solution found
+            del self.__pathdict[nVarSel]
+        return False     # Chronological backtracking
+
+    def __is_new(self, var, index):
+        return self.__old_domains is not None and not self.__old_domains[var] & (1 << index)
+
+    def __only_old(self, domains, labeled):
+        '''True if no unlabeled variable has values out of old_domains'''
+        if self.__old_domains is None:
+            return False
         for var in range(self.__nVAR):
-            if not self.__isVarLabeled(var, depth + 1):   # inc. current depth
-                self.__propagate(var, depth, elem)
-
-    def __unupdate(self, depth):
-        while(self.__history):
-            h = self.__history.pop()
-            if h.depth == depth:
-                self.__csp[h.var][h.nVal] = h.elem
-            else:
-                self.__history.append(h)             # Replaces element
-                break
+            if not labeled & (1 << var) and domains[var] & ~self.__old_domains[var]:
+                return False
+        return True
+
+    def __propagate(self, domains, labeled, var, index):
+        '''forward checking: filters unlabeled variables with the values compatible with
+        (var, index). Returns the new domains or None if a variable has no candidates'''
+        new_domains = list(domains)
+        for other in range(self.__nVAR):
+            if not labeled & (1 << other):
+                domain = domains[other]
+                filtered = self.__matrix.compatible(var, index, other, domain)
+                if filtered != domain:
+                    self.__nPropagations += _count_bits(domain ^ filtered)
+                    if not filtered:
+                        return None
+                    new_domains[other] = filtered
+        return new_domains
+
+    def __arcConsistent(self, domains, labeled):
+        '''AC-3 over unlabeled variables: removes values without any compatible value in
+        other variable. Returns None if a variable has no candidates.
+        Computes compatibility of values forward checking never uses, off by default'''
+        unlabeled = [var for var in range(self.__nVAR) if not labeled & (1 << var)]
+        changed = True
+        while changed:
+            changed = False
+            for var in unlabeled:
+                supported = 0
+                for index in _bits(domains[var]):
+                    if all(self.__matrix.compatible(var, index, other, domains[other])
+                           for other in unlabeled if other != var):
+                        supported |= 1 << index
+                if supported != domains[var]:
+                    if not supported:
+                        return None
+                    domains[var] = supported
+                    changed = True
+        return domains
 
     def __pathToSol(self, depth):
         '''stores new current best solution up to specified limit'''
         if len(self.__solSet) < CSPExact.MAX_NUM_SOL:
-            tupleset = set({})
-            for t in self.__pathdict.items():
-                tupleset.add(t)
-            else:
-                self.__solSet.append(tupleset)
+            self.__solSet.append(set(self.__pathdict.items()))
 
     def __storeSol(self, depth):
         '''stores sol if it is no worse than current champion
@@ -376,8 +506,4 @@ class CSPExact:
                 self.__depth_max = depth
                 self.__solSet[:] = []
                 logger.debug('new best solution found')
-        self.__pathToSol(depth)
-
-    def __isArcConsistent(self):
-        ''' computes Arc-Consistency at current step'''
-        pass
+            self.__pathToSol(depth)
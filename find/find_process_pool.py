@@ -0,0 +1,157 @@
+import cPickle
+import fcntl
+import multiprocessing
+import os
+import struct
+import traceback
+from gevent.os import make_nonblocking, nb_read, nb_write
+from gevent.queue import Queue
+from biicode.common.exception import BiiException
+from biicode.common.find.finder_request import FinderRequest
+from biicode.common.find.finder_result import FinderResult
+from biicode.common.utils.bii_logging import logger
+from biicode.server.find import finder_service
+from biicode.server.find.finder_service import FindService, RecordedOutput
+from biicode.server.store.mem_server_store import MemServerStore
+
+# Messages are pickled with a length prefix, so the parent reads them in chunks cooperatively
+_HEADER = struct.Struct("!I")
+_CHUNK_BYTES = 65536
+
+
+def _send(fd, message, write=os.write):
+    data = cPickle.dumps(message, cPickle.HIGHEST_PROTOCOL)
+    data = _HEADER.pack(len(data)) + data
+    while data:
+        data = data[write(fd, data):]
+
+
+def _receive(fd, read=os.read):
+    size, = _HEADER.unpack(_read_bytes(fd, _HEADER.size, read))
+    return cPickle.loads(_read_bytes(fd, size, read))
+
+
+def _read_bytes(fd, size, read):
+    chunks = []
+    while size:
+        chunk = read(fd, min(size, _CHUNK_BYTES))
+        if not chunk:
+            raise EOFError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return "".join(chunks)
+
+
+def _serve(conn, store_factory):
+    '''Worker process loop: receives (auth_user, serialized FinderRequest) and sends back
+    (serialized FinderResult, messages, exception, search_stats)'''
+    store = store_factory()
+    fd = conn.fileno()
+    # Blocking reads and writes in the worker, the pipe could come from gevent sockets
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+    while True:
+        try:
+            auth_user, serial_request = _receive(fd)
+        except EOFError:  # Pool closed
+            return
+        output = RecordedOutput()  # Its messages are replayed in the request biiout
+        serial_result, error = None, None
+        try:
+            request = FinderRequest.deserialize(serial_request)
+            service = FindService(MemServerStore(store), auth_user, store.find_result_cache)
+            serial_result = service.find(request, output).serialize()
+        except Exception as e:
+            logger.debug(traceback.format_exc())
+            error = e
+        stats = dict(finder_service.search_stats)
+        for key in finder_service.search_stats:
+            finder_service.search_stats[key] = 0
+        try:
+            cPickle.dumps(error, cPickle.HIGHEST_PROTOCOL)
+        except Exception:  # Not picklable exception
+            serial_result, error = None, BiiException(str(error))
+        _send(fd, (serial_result, output.messages, error, stats))
+
+
+class FindProcessPool(object):
+    '''Runs finds in worker processes, so the CPU bound search doesn't stop the other
+    greenlets of the web worker. Checking the compatibility of hypothesis reads the store,
+    so each process runs the whole find with its own store, built by store_factory.
+    Requests wait for a free process and for its result cooperatively. A process is only
+    reused after its whole result is read, otherwise (errors, killed greenlets) it is
+    replaced by a new one'''
+
+    def __init__(self, processes, store_factory):
+        self._store_factory = store_factory
+        self._idle = Queue()
+        for _ in range(processes):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_serve, args=(child_conn, self._store_factory))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        make_nonblocking(conn.fileno())
+        return process, conn
+
+    def _replace_worker(self, process, conn):
+        conn.close()
+        process.terminate()
+        process.join()
+        self._idle.put(self._start_worker())
+
+    def find(self, auth_user, request, biiout):
+        '''Same as FindService.find, the messages for biiout are written when it ends'''
+        process, conn = self._idle.get()
+        received = False
+        try:
+            _send(conn.fileno(), (auth_user, request.serialize()), nb_write)
+            serial_result, messages, error, stats = _receive(conn.fileno(), nb_read)
+            received = True
+        except (EOFError, IOError, OSError):
+            logger.error("Find worker process %s ended\n%s" % (process.pid,
+                                                               traceback.format_exc()))
+            raise BiiException("Server error while finding dependencies, try again")
+        finally:
+            if received:
+                self._idle.put((process, conn))
+            else:  # It could be still writing a result nobody will read
+                self._replace_worker(process, conn)
+
+        for key, value in stats.iteritems():
+            finder_service.search_stats[key] += value
+        RecordedOutput(messages).replay(biiout)
+        if error is not None:
+            raise error
+        return FinderResult.deserialize(serial_result)
+
+    def close(self):
+        '''Ends the idle processes'''
+        while not self._idle.empty():
+            process, conn = self._idle.get()
+            conn.close()
+            process.terminate()
+            process.join()
+
+
+_processes = 0
+_store_factory = None
+_pool = None
+
+
+def configure(processes, store_factory):
+    '''Finds of this process will run in a FindProcessPool of the given number of
+    processes, created on first use (after the web server forks its workers). 0 disables it'''
+    global _processes, _store_factory
+    _processes = processes
+    _store_factory = store_factory
+
+
+def get_find_process_pool():
+    '''The configured FindProcessPool, or None if finds run in the request greenlet'''
+    global _pool
+    if _pool is None and _processes:
+        _pool = FindProcessPool(_processes, _store_factory)
+    return _pool
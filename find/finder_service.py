@@ -1,26 +1,73 @@
 from biicode.common.find.finder_result import FinderResult
 from biicode.common.model.symbolic.block_version import BlockVersion
 from biicode.common.utils.bii_logging import logger
-from heapq import heappush
+from heapq import merge
 import traceback
+from gevent.pool import Pool
+from gevent.lock import BoundedSemaphore
+from biicode.server.conf import BII_FIND_MAX_CONCURRENT_CLOSURES,\
+    BII_FIND_MAX_PROCESS_CONCURRENT_CLOSURES, BII_FIND_MAX_SECONDS, BII_FIND_MAX_STEPS,\
+    BII_FIND_PLAN_LIMITS
+from biicode.server.utils.cache import canonical
+from biicode.server.utils.intern import names
+import hashlib
+from bson import BSON
 from copy import copy
 from biicode.common.exception import NotInStoreException, ForbiddenException
-from biicode.server.find.constraint_satisfaction import IterDeep
+from biicode.server.find.constraint_satisfaction import IterDeep, SearchBudget
 from biicode.server.authorize import Security
 from biicode.server.reference_translator.reference_translator_service import \
                                                                         ReferenceTranslatorService
 from biicode.server.find.hypothesis import Hypothesis
+from biicode.server.find.cell_names_index import CellNamesIndex
 from biicode.common.model.brl.group_name import BranchName
 
 
+# Shared by the finds of the process, bounded by the Mongo connection pool
+_closures_semaphore = BoundedSemaphore(BII_FIND_MAX_PROCESS_CONCURRENT_CLOSURES)
+
+# Counters of the searches of the process, for monitoring
+search_stats = {"searches": 0, "steps": 0,
+                "exhausted_" + SearchBudget.TIME: 0, "exhausted_" + SearchBudget.STEPS: 0}
+
+
+
+class RecordedOutput(object):
+    '''biiout that records its messages, to write them later in other biiout'''
+
+    def __init__(self, messages=None):
+        self.messages = messages if messages is not None else []  # [(level, message)]
+
+    def info(self, message):
+        self.messages.append(("info", message))
+
+    def warn(self, message):
+        self.messages.append(("warn", message))
+
+    def error(self, message):
+        self.messages.append(("error", message))
+
+    def debug(self, message):
+        self.messages.append(("debug", message))
+
+    def replay(self, biiout):
+        for level, message in self.messages:
+            getattr(biiout, level)(message)
+
+
 class FindService(object):
     MAX_HYP = 10
 
-    def __init__(self, store, auth_user):
+    def __init__(self, store, auth_user, result_cache=None):
+        '''result_cache: LRUCache of results shared by the finds of the process or None.
+        Permission changes don't invalidate its results, it should have a max_age'''
         self._store = store
         self._auth_user = auth_user
         self.security = Security(self._auth_user, self._store)
         self.translator = ReferenceTranslatorService(self._store, self._auth_user)
+        self._result_cache = result_cache
+        self._cacheable = True  # False if an error was ignored while finding
+        self._names_indexes = {}  # {(version, cur_version): CellNamesIndex}
 
     def find(self, request, biiout):
         '''
@@ -33,6 +80,82 @@ class FindService(object):
             raise ValueError('The find request is empty, nothing to find')
 
         logger.debug('---------FinderRequest ------------\n%s' % str(request))
+        if self._result_cache is None:
+            return self._find(request, biiout)
+
+        key = self._result_key(request)
+        cached = self._cached_result(key)
+        if cached is not None:
+            logger.debug("No changes in the candidate blocks since an equal find, same result")
+            serial_result, messages = cached
+            RecordedOutput(messages).replay(biiout)
+            return FinderResult.deserialize(serial_result)
+
+        # Counters read before the blocks, a publication during the find invalidates it
+        candidates = self._candidate_blocks(request)
+        current = self._store.read_block_change_counters(candidates)
+        counters = {brl: current.get(brl, 0) for brl in candidates}
+        output = RecordedOutput()
+        try:
+            result = self._find(request, output)
+        finally:
+            output.replay(biiout)
+        # And the dependencies, with the counters the store read before their dep tables
+        for brl, counter in self._store.block_counters.iteritems():
+            counters.setdefault(brl, counter)
+        blocks = self._result_blocks(result)
+        if self._cacheable and blocks.issubset(counters):
+            # Serialized, so the cached one can't be modified by the callers
+            entry = (result.serialize(), output.messages, counters, blocks)
+            self._result_cache.set(key, entry, self._entry_size(entry))
+        return result
+
+    def _result_key(self, request):
+        '''Results depend on the request and on the permissions of the user'''
+        serial = repr(canonical(request.serialize()))
+        return self._auth_user, hashlib.sha1(serial).hexdigest()
+
+    def _cached_result(self, key):
+        '''The cached result if none of the blocks it was computed with has changed and the
+        user can still read all the blocks of the result. Other permission changes (ex: the
+        user can read a new candidate) are only seen when the result expires'''
+        cached = self._result_cache.get(key)
+        if cached is None:
+            return None
+        serial_result, messages, counters, blocks = cached
+        current = self._store.read_block_change_counters(counters.keys())
+        if any(current.get(brl, 0) != counter for brl, counter in counters.iteritems()):
+            self._result_cache.delete(key)
+            return None
+        if blocks and self.security.filter_read_blocks(blocks) != blocks:
+            return None
+        return serial_result, messages
+
+    @staticmethod
+    def _result_blocks(result):
+        return {version.block for version in result.resolved.keys() + result.updated.keys()}
+
+    @staticmethod
+    def _entry_size(entry):
+        '''Size in bytes of a cached result, approximated with its BSON serialization'''
+        serial_result, messages, counters, blocks = entry
+        return len(BSON.encode({"result": serial_result, "messages": messages,
+                                "counters": counters.items(), "blocks": list(blocks)}))
+
+    @staticmethod
+    def _candidate_blocks(request):
+        '''Blocks whose new publications can change the result of request'''
+        candidates = {version.block for version in request.existing}
+        if request.find:
+            candidates.update(FindService._master_block(block_name)
+                              for block_name in request.possible_blocks())
+        return candidates
+
+    @staticmethod
+    def _master_block(block_name):
+        return block_name + BranchName("%s/master" % block_name.user)
+
+    def _find(self, request, biiout):
         result = FinderResult()
         # Copy unresolved and remove it if find the dependence
         result.unresolved = copy(request.unresolved)
@@ -43,6 +166,7 @@ class FindService(object):
             return result
 
         biiout.info("Analyzing compatibility for found dependencies... ")
+        self._precompute_closures(hypothesis)
         '''# primitive combinator variant
         analyzer = CompatibilityAnalyzer(self._store, self._auth_user)
         analysis_result = analyzer.solve(hypothesis)
@@ -54,10 +178,21 @@ class FindService(object):
         logger.info(csp.print_info())'''
 
         # iterative deepening variant
-        it = IterDeep(hypothesis, None, None)
+        budget = self._search_budget()
+        it = IterDeep(hypothesis, None, None, budget)
         sol_found, analysis_result = it.start()
+        self._count_search(budget)
+        logger.info("Closures fetched %d references, reused %d" % self._closure_stats(hypothesis))
         if sol_found:
             logger.info("sol found: {0} iter".format(it.num_iter))
+        elif budget.exhausted:
+            biiout.warn("The search of compatible versions exceeded its %s limit, the result "
+                        "is the best partial one found. Try again with a more specific policy"
+                        % budget.exhausted)
+            self._cacheable = False
+            if analysis_result:
+                analysis_result = self._compatible_partial(analysis_result, hypothesis,
+                                                           request)
 
         if analysis_result is None:
             biiout.error("Can't find a compatible solution")
@@ -72,6 +207,73 @@ class FindService(object):
         logger.debug('Result %s' % result)
         return result
 
+    @staticmethod
+    def _compatible_partial(partial, hypothesis, request):
+        '''Elements of a partial solution compatible with the current versions of the existing
+        dependencies the partial solution doesn't assign, as the client keeps them. When an
+        update of an existing dependency is discarded, its current version is kept and checked
+        as well'''
+        row_of = {id(hyp): index for index, row in enumerate(hypothesis) for hyp in row}
+        # The last hypothesis of the rows of existing dependencies is their current version
+        current = {index: row[-1] for index, row in enumerate(hypothesis)
+                   if row and row[-1].block_version in request.existing}
+        assigned = {row_of[id(elem)] for elem in partial}
+        kept = list(partial)
+        unassigned = [hyp for index, hyp in current.iteritems() if index not in assigned]
+        while True:
+            discarded = [elem for elem in kept
+                         if not all(elem.is_compatible(hyp) for hyp in unassigned)]
+            if not discarded:
+                return kept
+            logger.debug("Partial solution %s incompatible with existing dependencies"
+                         % discarded)
+            discarded_ids = {id(elem) for elem in discarded}
+            kept = [elem for elem in kept if id(elem) not in discarded_ids]
+            unassigned.extend(current[row_of[id(elem)]] for elem in discarded
+                              if row_of[id(elem)] in current)
+
+    def _search_budget(self):
+        '''SearchBudget with the limits of the plan of the user, or the default ones'''
+        max_seconds, max_steps = BII_FIND_MAX_SECONDS, BII_FIND_MAX_STEPS
+        if self._auth_user and BII_FIND_PLAN_LIMITS:
+            try:
+                plan_id = self._store.read_user_subscription(self._auth_user).plan_id
+            except NotInStoreException:
+                plan_id = None
+            max_seconds, max_steps = BII_FIND_PLAN_LIMITS.get(plan_id, (max_seconds, max_steps))
+        return SearchBudget(max_seconds or None, max_steps or None)
+
+    @staticmethod
+    def _count_search(budget):
+        search_stats["searches"] += 1
+        search_stats["steps"] += budget.steps
+        if budget.exhausted:
+            search_stats["exhausted_" + budget.exhausted] += 1
+
+    @staticmethod
+    def _closure_stats(hypothesis):
+        '''(fetched, reused) references by the compatibility closures of all the hypothesis'''
+        closures = [hyp.closure for row in hypothesis for hyp in row]
+        return (sum(closure.num_fetched for closure in closures),
+                sum(closure.num_reused for closure in closures))
+
+    def _precompute_closures(self, hypothesis):
+        '''Computes the block closures of all the hypothesis concurrently before the search,
+        as it is mostly waiting for store reads. Failures are ignored here, the lazy
+        computation during the search will raise them as before'''
+        hyps = [hyp for row in hypothesis for hyp in row]
+        if len(hyps) < 2 or BII_FIND_MAX_CONCURRENT_CLOSURES < 2:
+            return
+
+        def compute(hyp):
+            with _closures_semaphore:
+                try:
+                    hyp.block_closure
+                except Exception:
+                    logger.debug(traceback.format_exc())
+
+        Pool(min(BII_FIND_MAX_CONCURRENT_CLOSURES, len(hyps))).map(compute, hyps)
+
     def _get_hypothesis(self, request, biiresponse):
         hypothesis = []
         if request.find:
@@ -141,19 +343,15 @@ class FindService(object):
         original_date = current_block.deltas[time].date
         delta_versions = self._filter_by_policy(block_candidates, policy, biiout,
                                                 original_date, request)
-        logger.debug("The heap is %s" % delta_versions)
         hypothesis = self._define_hypothesis(delta_versions, dependencies, request.block_names,
                                              biiout, block_version)
         return hypothesis
 
-    def _match_declarations(self, decls, block, snap, cur_version, version):
+    def _match_declarations(self, decls, index):
         '''
         Params:
             decls: Current declarations for given block
-            block: Block to match
-            snap: dict {CellName => ID} for new version
-            cur_version: Current BlockVersion that decls are resolved to
-            version: New BlockVersion to evaluate
+            index: CellNamesIndex of the new version to evaluate
         Return:
             all_found: boolean
             names_total: set(BlockCellName)
@@ -162,18 +360,9 @@ class FindService(object):
         all_found = True
         deps_dict = {}
         names_total = set()
-        block_name = block.ID.block_name
 
         for decl in decls:
-            matchable_names = snap.keys()
-            renames = {}
-            if cur_version:
-                renames = block.get_renames(cur_version.time, version.time)
-                matchable_names.extend(renames.keys())  # Adding old names so decls matches
-
-            names = decl.match([block_name + name for name in matchable_names])
-            names = set([n if n.cell_name in snap.keys()
-                         else (block_name + renames[n.cell_name]) for n in names])  # Apply renames
+            names = index.match(decl)  # Renames already applied
             if names:
                 # In case of renames here we will have a mismatch between declaration and cell_name
                 # it will be corrected by client by updating declaration when it detects such
@@ -185,11 +374,27 @@ class FindService(object):
                 break
         return all_found, names_total, deps_dict
 
+    def _cell_names_index(self, version, cur_version):
+        '''CellNamesIndex of version, with the old names of the cells renamed since
+        cur_version, built once per find'''
+        key = version, cur_version
+        try:
+            return self._names_indexes[key]
+        except KeyError:
+            block = self._store.read_block(version.block)
+            cell_names = block.cells.get_all_ids(version.time).keys()
+            renames = None
+            if cur_version:
+                renames = block.get_renames(cur_version.time, version.time)
+            index = CellNamesIndex(block.ID.block_name, cell_names, renames)
+            self._names_indexes[key] = index
+            return index
+
     def _define_hypothesis(self, delta_versions, decls, existing_block_names, biiresponse,
                            cur_version=None):
         '''
         Parameters:
-            delta_versions: [(delta, block_version)], prioritized set of accepted hypothesis
+            delta_versions: iterator of (delta, block_version), accepted hypothesis by priority
             decls: {Declaration: set(BlockCellName)}
             existing_block_names = set(BlockName)
             cur_version: Current version that decls are resolved to
@@ -202,12 +407,8 @@ class FindService(object):
         #previous = None
         for _, version in delta_versions:
             logger.debug('Analyzing hypothesis %s' % str(version))
-            block = self._store.read_block(version.block)
-            snap = block.cells.get_all_ids(version.time)
-            #logger.debug('Current snap %s' % snap)
-
-            all_found, names_total, deps_dict = self._match_declarations(decls, block, snap,
-                                                                         cur_version, version)
+            index = self._cell_names_index(version, cur_version)
+            all_found, names_total, deps_dict = self._match_declarations(decls, index)
             if not all_found:
                 biiresponse.debug('Version %s discarded, only contains files for declarations %s'
                                   % (str(version), deps_dict.keys()))
@@ -236,39 +437,37 @@ class FindService(object):
 
     def _filter_by_policy(self, block_candidates, policy, biiresponse,
                           original_date=None, request=None):
-        '''computes list of (block_delta, block_version) for each block candidate'''
-        delta_versions = []
+        '''iterator of ((-date, -num_version), block_version) of the versions of the block
+        candidates accepted by policy, newest first. Versions are evaluated as they are
+        consumed, so the old ones are never evaluated if enough hypothesis are found'''
+        min_date = None
+        if request and not request.downgrade:
+            min_date = original_date
+        accepted = []
         for block_candidate in block_candidates:
             self.security.check_read_block(block_candidate)
             biiresponse.info("Block candidate: %s" % str(block_candidate))
             block = self._store.read_block(block_candidate)
-
-            # from last to 0, backwards
-            for num_version in range(len(block.deltas) - 1, -1, -1):
-                tag = block.deltas[num_version].tag
-                date = block.deltas[num_version].date
-                if request:
-                    if not request.downgrade and date <= original_date:
-                        continue
-                version = BlockVersion(block.ID, num_version)
-                ev = policy.evaluate(version, tag)
-                if ev:
-                    heappush(delta_versions, ((-date, -num_version), version))
-                    biiresponse.info("\tVersion %s (%s) valid" % (version, tag))
-                else:
-                    biiresponse.info("\tVersion %s (%s) discarded" % (version, tag))
-
-        return delta_versions
+            accepted.append(self._accepted_versions(block, policy, biiresponse, min_date))
+        return merge(*accepted)
+
+    def _accepted_versions(self, block, policy, biiresponse, min_date):
+        for num_version, tag, date in block.versions_index.newest(min_date):
+            version = names.intern(BlockVersion(block.ID, num_version))
+            if policy.evaluate(version, tag):
+                biiresponse.info("\tVersion %s (%s) valid" % (version, tag))
+                yield (-date, -num_version), version
+            else:
+                biiresponse.info("\tVersion %s (%s) discarded" % (version, tag))
 
     def _compute_new(self, block_name, decls, policy, existing_block_names, biiresponse):
         try:
             biiresponse.info("Looking for %s..." % block_name)
             # branches = self._store.read_tracks(block_name)
             # branches.get_blocks()
-            block_candidates = [block_name + BranchName("%s/master" % block_name.user)]
+            block_candidates = [self._master_block(block_name)]
             block_candidates = policy.filter(block_candidates)
             delta_versions = self._filter_by_policy(block_candidates, policy, biiresponse)
-            logger.debug("The heap is %s" % delta_versions)
             result = self._define_hypothesis(delta_versions, decls,
                                              existing_block_names, biiresponse)
             return result
@@ -280,4 +479,5 @@ class FindService(object):
         except Exception:
             biiresponse.error("Fatal error in server while reading %s" % block_name)
             logger.error(traceback.format_exc())
+            self._cacheable = False
             return []
@@ -1,8 +1,6 @@
 from biicode.common.model.symbolic.reference import References
-from biicode.common.deps.block_version_graph_builder import block_version_graph_build
 from biicode.server.deps.compatibility_closure_builder import build_compatibility_closure
 from biicode.server.deps.compatibility_closure import CompatibilityClosure
-from biicode.common.model.symbolic.block_version_table import BlockVersionTable
 
 
 class Hypothesis(object):
@@ -42,9 +40,7 @@ class Hypothesis(object):
     @property
     def block_closure(self):  # Lazy computation of closures
         if self._block_closure is None:
-            self._block_closure, _ = block_version_graph_build(self._ref_translator.get_dep_table,
-                                                        [self.block_version],
-                                                        BlockVersionTable())
+            self._block_closure = self._ref_translator.get_block_closure(self.block_version)
         return self._block_closure
 
     def is_compatible(self, other):
@@ -60,7 +56,7 @@ class Hypothesis(object):
 
         build_compatibility_closure(self._ref_translator, c1, graph_collision.nodes, self.block_closure)
         build_compatibility_closure(self._ref_translator, c2, graph_collision.nodes, other.block_closure)
-        return c1.conflicts(c2) == 0
+        return c1.is_compatible(c2)
 
     def __repr__(self):
         return repr(self.block_version)
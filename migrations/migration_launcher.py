@@ -1,7 +1,7 @@
 from biicode.server.conf import BII_MONGO_URI, BII_MAX_MONGO_POOL_SIZE
 from biicode.common.migrations.migration_manager import MigrationManager
 from biicode.server.store.migration_store import MigrationStore
-from biicode.server.store.mongo_server_store import MongoServerStore
+from biicode.server.store.store_factory import build_store
 import time
 from pymongo.mongo_client import MongoClient
 from biicode.server.migrations.migrations import SERVER_MIGRATIONS
@@ -15,7 +15,8 @@ def launch():
     # fsync=False the server does not add Sync to disk. to the getlasterror command
     mongo_connection = MongoClient(BII_MONGO_URI, max_pool_size=BII_MAX_MONGO_POOL_SIZE)
     migration_store = MigrationStore(mongo_connection)
-    server_store = MongoServerStore(mongo_connection)
+    # With the memcache proxy, so the cached elements migrated are invalidated
+    server_store = build_store(mongo_connection, process_caches=False)
     biiout = OutputStream()
     manager = MigrationManager(migration_store, SERVER_MIGRATIONS, biiout)
 
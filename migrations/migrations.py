@@ -1,4 +1,5 @@
 from biicode.common.migrations.migration import Migration
+from biicode.server.store.generic_server_store import GenericServerStore
 
 
 ######### DO NOT DELETE *NEVER* A CLASS FROM THIS MODULE ##############
@@ -43,6 +44,25 @@ class ComputeUserWorkspaceSizes(Migration):
         pass
 
 
+class ComputePublishedMinCells(Migration):
+    '''Backfills published_min_cell collection, read by FIND instead of the whole cells'''
+
+    BATCH_SIZE = 1000
+
+    def migrate(self, *args, **kwargs):
+        server_store = kwargs.pop("server_store")
+        dbcol = server_store.db[GenericServerStore.PUBLISHED_CELL_ST]
+        deserializer = server_store.getDeserializer(GenericServerStore.PUBLISHED_CELL_ST)
+        batch = []
+        for doc in dbcol.find():
+            batch.append(deserializer.deserialize(doc))
+            if len(batch) == self.BATCH_SIZE:
+                server_store.upsert_published_min_cells(batch)
+                batch = []
+        if batch:
+            server_store.upsert_published_min_cells(batch)
+
+
 # DO NOT DELETE **NEVER** ELEMENTS IN THIS LIST. ONLY APPEND NEW MIGRATIONS!!
 SERVER_MIGRATIONS = [
     AddContributorsAndPermissionsToWorkspace(),  # Add contributors and permissions to workspace
@@ -50,5 +70,6 @@ SERVER_MIGRATIONS = [
     PGUserAndWorkspaceToUser(),  # Change user workspace structure for search capability
     EnsureUserSubscriptionCreated(),  # All users with empty suscription
     ResetUserSubscription(),
-    ComputeUserWorkspaceSizes()  # Compute the size of contents of users
+    ComputeUserWorkspaceSizes(),  # Compute the size of contents of users
+    ComputePublishedMinCells()  # Precompute root and dependencies of published cells
 ]
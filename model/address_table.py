@@ -1,27 +1,33 @@
-from biicode.server.model.time_base_map import TimeBaseMap
+from bisect import bisect_right
+from collections import defaultdict, OrderedDict
+from itertools import islice, izip
+from biicode.server.model.time_base_map import IDTimeBaseMap
 from biicode.common.model.id import ID
 from biicode.common.utils.serializer import DictDeserializer
 from biicode.common.model.brl.cell_name import CellName
-from biicode.server.model.time_base_map import TimeBaseMapDeserializer
+from biicode.server.utils.intern import names
+from biicode.server.conf import BII_SNAPSHOT_CHECKPOINT_VERSIONS, BII_SNAPSHOT_MAX_CHECKPOINTS
 
 
 class AddressTable(dict):
     '''
     In this version, the last Integer of the ID is stored at each cell, or the full ID for tracking
     tested several approaches for efficiency, this seems to be pretty good
-    with access times <1microsecond for 100 versions, all changing
+    with access times <1microsecond for 100 versions, all changing.
+    The maps of the cells are IDTimeBaseMap, with times and local IDs in int arrays, about
+    4 times smaller than lists of IDs (see AddressTableTest.test_memory).
+    Snapshots of all the names (get_all_ids) are computed from checkpoints, see _Snapshots
     '''
 
     def __init__(self, block_id):
         self._block_id = block_id  # ID (user, block), transient
+        self._snapshots = None  # _Snapshots, transient, built on first use
 
     def all_ids(self):
         result = set()
         for time_map in self.itervalues():
-            for id_ in time_map[1]:
-                # Only self IDs, external will not be deleted
-                if id_ is not None and len(id_) == 1:  # Check if its a resourceID
-                    result.add(self._block_id + id_[0])  # Get int resource value
+            # Only self IDs, external will not be deleted
+            result.update(self._block_id + value for value in time_map.local_ids())
         return result
 
     def last(self, name):
@@ -31,12 +37,14 @@ class AddressTable(dict):
             return None, None
 
     def pop_dev(self, name, time):
+        self._snapshots = None
         try:
             return self[name].pop_dev(time)
         except KeyError:
             return None
 
     def delete(self, name, current_time):
+        self._snapshots = None
         self[name].append(current_time, None)
 
     def create(self, name, item_id, current_time):
@@ -44,7 +52,8 @@ class AddressTable(dict):
             id_ = ID((item_id[2], ))
         else:
             id_ = item_id
-        return self.setdefault(name, TimeBaseMap()).append(current_time, id_)
+        self._snapshots = None
+        return self.setdefault(name, IDTimeBaseMap()).append(current_time, id_)
 
     def get_id(self, name, time):
         '''Computes the resource in the time slot. Resolves for resources
@@ -64,15 +73,15 @@ class AddressTable(dict):
         return result
 
     def get_all_ids(self, time):
-        result = {}
-        for name, time_map in self.iteritems():
-            id_ = self._get_id(time_map, time)
-            if id_ is not None:
-                result[name] = id_
-        return result
+        if self._snapshots is None:
+            self._snapshots = _Snapshots(self, BII_SNAPSHOT_CHECKPOINT_VERSIONS,
+                                         BII_SNAPSHOT_MAX_CHECKPOINTS)
+        return self._snapshots.get(time)
 
     def _get_id(self, time_based_map, time):
-        id_ = time_based_map.find(time)
+        return self._resolve(time_based_map.find(time))
+
+    def _resolve(self, id_):
         if id_ is not None and len(id_) == 1:  # Check if its a resourceID
             return self._block_id + id_[0]  # Get int resource value
         return id_
@@ -80,6 +89,55 @@ class AddressTable(dict):
     @staticmethod
     def deserialize(doc, block_id):
         m = AddressTable(block_id)
-        tmp = DictDeserializer(CellName, TimeBaseMapDeserializer(ID)).deserialize(doc)
-        m.update(tmp)
+        tmp = DictDeserializer(CellName, IDTimeBaseMap).deserialize(doc)
+        # Cells and contents tables, and other reads of the block, share the names
+        m.update((names.intern(name), time_map) for name, time_map in tmp.iteritems())
         return m
+
+
+class _Snapshots(object):
+    '''Changes of an AddressTable grouped by time, and the snapshots {name: ID} after every
+    `interval` versions with changes, as checkpoints. The snapshot of a time is a copy of the
+    previous checkpoint plus the following changes, instead of a search of every name.
+    Checkpoints are computed when first needed, from the nearest previous one. Tables are
+    kept in the block cache, which doesn't count them, so only the `max_checkpoints` most
+    recently used are kept'''
+
+    def __init__(self, table, interval, max_checkpoints):
+        changes = defaultdict(list)  # {time: [(name, ID or None)]}
+        for name, time_map in table.iteritems():
+            for time, id_ in izip(time_map.times, time_map.items):
+                changes[time].append((name, table._resolve(id_)))
+        self._times = sorted(changes)
+        self._changes = [changes[time] for time in self._times]
+        self._interval = interval
+        self._max_checkpoints = max_checkpoints
+        self._checkpoints = OrderedDict()  # {num applied changes / interval: snapshot}, LRU
+
+    def get(self, time):
+        num_changes = bisect_right(self._times, time)
+        index = num_changes // self._interval
+        result = self._checkpoint(index).copy()
+        self._apply(result, index * self._interval, num_changes)
+        return result
+
+    def _checkpoint(self, index):
+        if index == 0:
+            return {}
+        snapshot = self._checkpoints.pop(index, None)
+        if snapshot is None:
+            previous = max([i for i in self._checkpoints if i < index] or [0])
+            snapshot = self._checkpoints[previous].copy() if previous else {}
+            self._apply(snapshot, previous * self._interval, index * self._interval)
+            while self._checkpoints and len(self._checkpoints) >= self._max_checkpoints:
+                self._checkpoints.popitem(last=False)
+        self._checkpoints[index] = snapshot  # Most recently used
+        return snapshot
+
+    def _apply(self, snapshot, begin, end):
+        for changes in islice(self._changes, begin, end):
+            for name, id_ in changes:
+                if id_ is None:
+                    snapshot.pop(name, None)
+                else:
+                    snapshot[name] = id_
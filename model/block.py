@@ -4,7 +4,7 @@ from biicode.common.model.symbolic.block_version import BlockVersion
 from biicode.common.model.brl.brl_block import BRLBlock
 from biicode.common.model.block_delta import BlockDelta
 from biicode.common.model.symbolic.block_version_table import BlockVersionTable
-from biicode.common.exception import PublishException
+from biicode.common.exception import PublishException, BiiStoreException
 import time
 from biicode.common.utils.bii_logging import logger
 from biicode.common.utils.serializer import Serializer, ListDeserializer
@@ -12,6 +12,8 @@ from biicode.common.model.id import ID
 from biicode.server.model.time_base_map import TimeBaseMapDeserializer
 from biicode.common.model.renames import Renames
 from biicode.common.model.version_tag import DEV
+from biicode.server.utils.intern import names
+from biicode.server.model.versions_index import VersionsIndex
 
 
 class Block(object):
@@ -26,8 +28,13 @@ class Block(object):
         self._deltas = []
         self._cell_count = 0
         self._content_count = 0
+        self._unread = set()  # Tables (SERIAL_* keys) not read from store in partial reads
+        self._raw = {}  # {SERIAL_* key: serialized table}, deserialized on first access
+        self._read_only = False  # Shared with other requests (cached), can't be published
+        self._versions_index = None  # Built on first use, kept with the block
 
     def __repr__(self):
+        self._load_all()
         result = []
         result.append('Block ' + repr(self._numeric_id) + repr(self._id))
         result.append(repr(self._cells_table))
@@ -36,7 +43,7 @@ class Block(object):
         return '\n'.join(result)
 
     def all_ids(self):
-        return self._cells_table.all_ids(), self._contents_table.all_ids()
+        return self.cells.all_ids(), self.contents.all_ids()
 
     @property
     def ID(self):
@@ -48,20 +55,54 @@ class Block(object):
 
     @property
     def cells(self):
+        self._load(Block.SERIAL_CELL_TABLE)
         return self._cells_table
 
     @property
     def contents(self):
+        self._load(Block.SERIAL_CONTENT_TABLE)
         return self._contents_table
 
     @property
     def dep_tables(self):
+        self._load(Block.SERIAL_DEPS_TABLE)
         return self._deps_table
 
     @property
     def deltas(self):
+        self._load(Block.SERIAL_DELTAS)
         return self._deltas
 
+    @property
+    def versions_index(self):
+        '''VersionsIndex of the deltas, a cached block builds it once for all the finds'''
+        if self._versions_index is None:
+            self._versions_index = VersionsIndex(self.deltas)
+        return self._versions_index
+
+    @property
+    def partial(self):
+        '''True if the block was read from store with only some of its tables'''
+        return bool(self._unread)
+
+    def set_read_only(self):
+        '''Marks the block as shared, for example by a cache of blocks, so it can't be
+        published. Its tables must not be modified either'''
+        self._read_only = True
+
+    def _load(self, table_key):
+        '''Ensures table_key table is available, deserializing it if it is still raw'''
+        if table_key in self._raw:
+            self._deserialize_table(table_key, self._raw.pop(table_key))
+        elif table_key in self._unread:
+            raise BiiStoreException("Table '%s' of block %s was not read from store"
+                                    % (table_key, self._id))
+
+    def _load_all(self):
+        '''Deserializes all the raw tables, the not read ones are left unavailable'''
+        for table_key in self._raw.keys():
+            self._load(table_key)
+
     @property
     def cell_count(self):
         return self._cell_count
@@ -77,13 +118,14 @@ class Block(object):
         return self.deltas[len(self.deltas) - 1]
 
     def last_version(self):
-        last_delta = len(self._deltas) - 1
-        versiontag = self._deltas[last_delta].versiontag if last_delta >= 0 else None
+        deltas = self.deltas
+        last_delta = len(deltas) - 1
+        versiontag = deltas[last_delta].versiontag if last_delta >= 0 else None
         return BlockVersion(self._id, last_delta, versiontag)
 
     def last_version_cells(self):
         ''' Returns a dict {CellName => ID} with last version's cells '''
-        return self.cells.get_all_ids(len(self._deltas) - 1)
+        return self.cells.get_all_ids(len(self.deltas) - 1)
 
     def get_renames(self, begin, end):
         '''Gets renames between given versions
@@ -93,6 +135,7 @@ class Block(object):
         Returns:
             Dict { old_cell_name => new_cell_name}
         '''
+        self._load(Block.SERIAL_RENAMES)
         renames = Renames()
         for r in self._renames.xrange(begin + 1, end + 1):
             renames. cat(r)
@@ -100,6 +143,12 @@ class Block(object):
 
     def add_publication(self, publish_request, commiter=None):
         logger.debug("--------------Requested publication---------\n %s" % repr(publish_request))
+        if self.partial:
+            raise BiiStoreException("Cannot publish in partially read block %s" % self._id)
+        if self._read_only:
+            raise BiiStoreException("Cannot publish in read only block %s" % self._id)
+        self._load_all()
+        self._versions_index = None
 
         current_time = len(self._deltas)
         delta = BlockDelta(publish_request.msg, publish_request.tag,
@@ -189,11 +238,14 @@ class Block(object):
 
     def publish_datetime(self, time):
         '''Get the publication date of version "time"'''
-        return self._deltas[time].date
+        return self.deltas[time].date
 
     def __eq__(self, other):
         if self is other:
             return True
+        if isinstance(other, self.__class__):
+            self._load_all()
+            other._load_all()
         return isinstance(other, self.__class__) \
             and self._numeric_id == other._numeric_id \
             and self._id == other._id \
@@ -218,10 +270,16 @@ class Block(object):
     SERIAL_DELTAS = 'dl'
     SERIAL_CELLS_COUNTER = 'i'
     SERIAL_CONTENT_COUNTER = 'j'
+    SERIAL_TABLES = (SERIAL_CELL_TABLE, SERIAL_CONTENT_TABLE, SERIAL_DEPS_TABLE, SERIAL_RENAMES,
+                     SERIAL_DELTAS)
 
     def serialize(self):
         # TODO Add the rest of attributes
         assert isinstance(self._numeric_id, ID), self._numeric_id.__class__
+        if self.partial:
+            # Writing it would overwrite the not read tables with empty ones
+            raise BiiStoreException("Cannot serialize partially read block %s" % self._id)
+        self._load_all()
         return Serializer().build(
                 (self.SERIAL_ID_KEY, self._id),
                 (self.SERIAL_NUMERIC_ID_KEY, self._numeric_id),
@@ -236,13 +294,29 @@ class Block(object):
 
     @staticmethod
     def deserialize(doc):
+        '''doc can be a partial block document (a projection of some tables), the tables
+        not present in doc will not be accessible in the returned Block.
+        Tables are kept serialized and deserialized on first access'''
         numeric_id = ID.deserialize(doc[Block.SERIAL_NUMERIC_ID_KEY])
-        m = Block(brl_id=BRLBlock(doc[Block.SERIAL_ID_KEY]), numeric_id=numeric_id)
-        m._cells_table = AddressTable.deserialize(doc[Block.SERIAL_CELL_TABLE], numeric_id)
-        m._contents_table = AddressTable.deserialize(doc[Block.SERIAL_CONTENT_TABLE], numeric_id)
-        m._deps_table = TimeBaseMapDeserializer(BlockVersionTable).deserialize(doc[Block.SERIAL_DEPS_TABLE])
-        m._renames = TimeBaseMapDeserializer(Renames).deserialize(doc[Block.SERIAL_RENAMES])
-        m._deltas = ListDeserializer(BlockDelta).deserialize(doc[Block.SERIAL_DELTAS])
+        m = Block(brl_id=names.intern(BRLBlock(doc[Block.SERIAL_ID_KEY])), numeric_id=numeric_id)
+        for table_key in Block.SERIAL_TABLES:
+            if table_key in doc:
+                m._raw[table_key] = doc[table_key]
+            else:
+                m._unread.add(table_key)
         m._cell_count = int(doc[Block.SERIAL_CELLS_COUNTER])
         m._content_count = int(doc[Block.SERIAL_CONTENT_COUNTER])
         return m
+
+    def _deserialize_table(self, table_key, doc):
+        if table_key == Block.SERIAL_CELL_TABLE:
+            self._cells_table = AddressTable.deserialize(doc, self._numeric_id)
+        elif table_key == Block.SERIAL_CONTENT_TABLE:
+            self._contents_table = AddressTable.deserialize(doc, self._numeric_id)
+        elif table_key == Block.SERIAL_DEPS_TABLE:
+            self._deps_table = TimeBaseMapDeserializer(BlockVersionTable).deserialize(doc)
+        elif table_key == Block.SERIAL_RENAMES:
+            self._renames = TimeBaseMapDeserializer(Renames).deserialize(doc)
+        elif table_key == Block.SERIAL_DELTAS:
+            self._deltas = ListDeserializer(BlockDelta).deserialize(doc)
+            self._versions_index = None
@@ -0,0 +1,58 @@
+from biicode.common.utils.serializer import Serializer
+from biicode.common.model.id import ID
+from biicode.common.model.brl.block_cell_name import BlockCellName
+from biicode.common.model.cells import SimpleCell
+from biicode.server.utils.intern import names
+
+
+class MinCell(object):
+    '''Minimum information of a published cell required by compatibility checks (FIND):
+    its root ID and the block cell names it depends on'''
+
+    SERIAL_ID_KEY = "_id"
+    SERIAL_ROOT_KEY = "r"
+    SERIAL_DEPS_KEY = "d"
+
+    def __init__(self, id_, root, deps):
+        self.ID = id_
+        self.root = root
+        self.deps = deps
+
+    @staticmethod
+    def from_cell(cell):
+        if isinstance(cell, SimpleCell):
+            deps = list(cell.dependencies.targets)
+        else:
+            deps = list(cell.resource_leaves)
+        return MinCell(cell.ID, cell.root, deps)
+
+    @property
+    def value(self):
+        '''(rootID, [deps_block_cell_names]) as used by MemServerStore.read_min_cells'''
+        return self.root, self.deps
+
+    def serialize(self):
+        return Serializer().build((self.SERIAL_ID_KEY, self.ID),
+                                  (self.SERIAL_ROOT_KEY, self.root),
+                                  (self.SERIAL_DEPS_KEY, self.deps))
+
+    @staticmethod
+    def deserialize(data):
+        root = data[MinCell.SERIAL_ROOT_KEY]
+        return MinCell(ID.deserialize(data[MinCell.SERIAL_ID_KEY]),
+                       ID.deserialize(root) if root is not None else None,
+                       [names.intern(BlockCellName(dep)) for dep in data[MinCell.SERIAL_DEPS_KEY]])
+
+    def __repr__(self):
+        return "%s: %s => %s" % (self.ID, self.root, self.deps)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return isinstance(other, self.__class__) \
+            and self.ID == other.ID \
+            and self.root == other.root \
+            and self.deps == other.deps
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
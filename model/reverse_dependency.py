@@ -1,5 +1,6 @@
 from biicode.common.utils.serializer import Serializer, ListDeserializer
 from biicode.common.model.symbolic.block_version import BlockVersion
+from biicode.server.utils.intern import names
 
 
 class LengthySerializedBlockVersion(BlockVersion):
@@ -23,12 +24,12 @@ class LengthySerializedBlockVersion(BlockVersion):
 
     @staticmethod
     def deserialize(data):
-        return LengthySerializedBlockVersion.loads("%s/%s(%s/%s):%i" % \
+        return names.intern(LengthySerializedBlockVersion.loads("%s/%s(%s/%s):%i" % \
                                   (data[LengthySerializedBlockVersion.SERIAL_CREATOR_KEY],
                                    data[LengthySerializedBlockVersion.SERIAL_NAME_KEY],
                                    data[LengthySerializedBlockVersion.SERIAL_OWNER_KEY],
                                    data[LengthySerializedBlockVersion.SERIAL_BRANCH_KEY],
-                                   data[LengthySerializedBlockVersion.SERIAL_VERSION_KEY]))
+                                   data[LengthySerializedBlockVersion.SERIAL_VERSION_KEY])))
 
 
 class ReverseDependency(object):
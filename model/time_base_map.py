@@ -1,10 +1,14 @@
 import bisect
-from biicode.common.utils.serializer import ListDeserializer
+from array import array
+from itertools import izip
+from biicode.common.model.id import ID
+from biicode.common.utils.serializer import ListDeserializer, serialize
 
 
 class TimeBaseMap(tuple):
     '''
-    Two lists, first of time, second of ID or BlockVersionTable or set or Renames
+    Two lists, first of time, second of BlockVersionTable or set or Renames.
+    Maps of IDs are IDTimeBaseMap
     '''
     def __new__(cls, data=None):
         if not data:
@@ -51,3 +55,100 @@ class TimeBaseMapDeserializer(object):
         times = doc[0]  # Not need to deserialize
         items = ListDeserializer(self.kls).deserialize(doc[1])
         return TimeBaseMap((times, items))
+
+
+# Packed values of IDTimeBaseMap that are not local IDs
+_NONE = -1
+_FOREIGN = -2  # _FOREIGN - i is the i-th foreign ID
+
+
+class IDTimeBaseMap(object):
+    '''Same as a TimeBaseMap of IDs, with the times and the IDs in int arrays. Local IDs
+    (the 1-length IDs of AddressTable) are stored as its int, deletions (None) as -1 and
+    foreign IDs as -2 - their index in a list, the only IDs kept as objects.
+    Items are returned as in TimeBaseMap, and serialized with the same format'''
+    __slots__ = ('times', 'packed', 'foreign')
+
+    def __init__(self):
+        self.times = array('i')
+        self.packed = array('i')
+        self.foreign = []  # [ID]
+
+    def _pack(self, id_):
+        if id_ is None:
+            return _NONE
+        if len(id_) == 1:
+            return id_[0]
+        self.foreign.append(id_)
+        return _FOREIGN - (len(self.foreign) - 1)
+
+    def _unpack(self, value):
+        if value >= 0:
+            return ID((value, ))
+        if value == _NONE:
+            return None
+        return self.foreign[_FOREIGN - value]
+
+    def pop_dev(self, time):
+        if self.times and self.times[-1] == time:
+            self.times.pop()
+            item = self._unpack(self.packed.pop())
+            if item is not None and len(item) > 1:
+                self.foreign.pop()  # Always the last one, they are appended in order
+            return item
+
+    def last(self):
+        if not self.times:
+            return None, None
+        return self.times[-1], self._unpack(self.packed[-1])
+
+    def append(self, time, item):
+        self.times.append(time)
+        self.packed.append(self._pack(item))
+
+    def find(self, time):
+        index = bisect.bisect_right(self.times, time)
+        if not index:
+            return None
+        return self._unpack(self.packed[index - 1])
+
+    def xrange(self, begin, end):
+        for time, value in izip(self.times, self.packed):
+            if begin <= time < end:
+                yield self._unpack(value)
+
+    def local_ids(self):
+        '''Generator of the ints of the local IDs'''
+        return (value for value in self.packed if value >= 0)
+
+    @property
+    def items(self):
+        return [self._unpack(value) for value in self.packed]
+
+    def __len__(self):
+        return len(self.times)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return isinstance(other, self.__class__) \
+            and self.times == other.times \
+            and self.items == other.items
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr((self.times.tolist(), self.items))
+
+    def serialize(self):
+        return serialize((self.times.tolist(), self.items))
+
+    @staticmethod
+    def deserialize(doc):
+        result = IDTimeBaseMap()
+        result.times.extend(doc[0])
+        result.packed.extend(result._pack(id_) for id_ in ListDeserializer(ID).deserialize(doc[1]))
+        return result
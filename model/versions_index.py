@@ -0,0 +1,32 @@
+from bisect import bisect_right
+from itertools import islice, izip
+
+
+class VersionsIndex(object):
+    '''Tags and dates of the versions of a block, to walk them newest first without
+    evaluating the old ones. Dates grow with the version number, so the versions published
+    after a date are found with a binary search. If they don't (clock changes), versions are
+    sorted by date'''
+
+    def __init__(self, deltas):
+        self.tags = [delta.tag for delta in deltas]
+        self.dates = [delta.date for delta in deltas]
+        self._sorted = all(date <= next_date
+                           for date, next_date in izip(self.dates, islice(self.dates, 1, None)))
+
+    def __len__(self):
+        return len(self.dates)
+
+    def newest(self, min_date=None):
+        '''Generator of (num_version, tag, date), newest first (by date, then by number).
+        If min_date is given, only the versions published after it'''
+        dates = self.dates
+        if self._sorted:
+            first = bisect_right(dates, min_date) if min_date is not None else 0
+            num_versions = xrange(len(dates) - 1, first - 1, -1)
+        else:
+            num_versions = sorted((num for num in xrange(len(dates))
+                                   if min_date is None or dates[num] > min_date),
+                                  key=lambda num: (dates[num], num), reverse=True)
+        for num_version in num_versions:
+            yield num_version, self.tags[num_version], dates[num_version]
@@ -59,7 +59,7 @@ class PublishService(object):
             self.security.check_read_block(target_block)
             self.security.check_publish_block(target_block, publish_request)
             # biiresponse.debug('Read block "%s"' % brl_block)
-            block = self._store.read_block(target_block)
+            block = self._store.read_block_for_update(target_block)
             (cells, contents,
              old_cells_ids, old_content_ids) = self._in_memory_block_update(block, publish_request)
         except ForbiddenException:
@@ -79,6 +79,7 @@ class PublishService(object):
         try:
             self._write_resources_to_db(cells, contents, old_cells_ids, old_content_ids)
             self._store.update_block(block)
+            self._store.bump_block_change_counter(target_block)
             self._store.commitBlockTransaction(target_block)
             register_publish(self.auth_user, block.last_version())
             self._store.finishBlockTransaction(target_block)
@@ -121,16 +122,19 @@ class PublishService(object):
         '''rollback transaction for publish'''
         logger.warning(str(excp) + '\nRolling back publish transaction')
         self._store.rollBackBlockTransaction(brl_block)
+        self._store.bump_block_change_counter(brl_block)
         self._store.finishBlockTransaction(brl_block)
 
     def _write_resources_to_db(self, cells, contents, old_cells_ids, old_content_ids):
         '''Write cells and contents to db'''
         if old_cells_ids:
             self._store.delete_published_cells(old_cells_ids)
+            self._store.delete_published_min_cells(old_cells_ids)
         if old_content_ids:
             self._store.delete_published_contents(old_content_ids)
         if cells:
             self._store.create_published_cells(cells)
+            self._store.upsert_published_min_cells(cells)
         if contents:
             self._store.create_published_contents(contents)
 
@@ -183,7 +187,7 @@ class PublishService(object):
             block_info.can_write = False
 
         try:
-            block = self._store.read_block(brl_block)
+            block = self._store.read_block(brl_block, [Block.SERIAL_DELTAS])
             block_info.last_version = block.last_version()
             block_info.private = self.security.is_private(brl_block)
         except Exception as e:
@@ -1,7 +1,9 @@
 from biicode.common.model.symbolic.reference import ReferencedResources
 from biicode.common.model.resource import Resource
-from biicode.common.exception import NotInStoreException, ForbiddenException
 from biicode.server.authorize import Security
+from biicode.server.model.block import Block
+from biicode.common.deps.block_version_graph_builder import block_version_graph_build
+from biicode.common.model.symbolic.block_version_table import BlockVersionTable
 from collections import defaultdict
 
 
@@ -12,54 +14,87 @@ class ReferenceTranslatorService(object):
         self.security = Security(auth_user, self._store)
 
     def get_published_resources(self, references):
+        '''Reads the resources of all the block versions with a constant number of store reads:
+        permissions, blocks, cells and contents. Not readable or not found blocks are skipped'''
         result = ReferencedResources()
+        blocks = self._read_blocks(references, [Block.SERIAL_CELL_TABLE,
+                                                Block.SERIAL_CONTENT_TABLE])
+        ids = {}  # {block_version: (cell_ids, content_ids)}
+        all_cell_ids, all_content_ids = set(), set()
         for block_version, cell_names in references.iteritems():
-            try:
-                self.security.check_read_block(block_version.block)
-                block = self._store.read_block(block_version.block)
-                cell_ids = block.cells.get_ids(cell_names, block_version.time)
-                content_ids = block.contents.get_ids(cell_names, block_version.time)
-                cells = self._store.read_published_cells(cell_ids.values())
-                contents = self._store.read_published_contents(content_ids.values())
-                for name, rID in cell_ids.iteritems():
-                    if name in content_ids:
-                        cid = content_ids[name]
-                        cid = contents[cid]
-                    else:
-                        cid = None  # Virtual resource
-                    result[block_version][name] = Resource(cells[rID], cid)
-            except (ForbiddenException, NotInStoreException):
-                pass
+            block = blocks.get(block_version.block)
+            if block is None:
+                continue
+            cell_ids = block.cells.get_ids(cell_names, block_version.time)
+            content_ids = block.contents.get_ids(cell_names, block_version.time)
+            ids[block_version] = cell_ids, content_ids
+            all_cell_ids.update(cell_ids.itervalues())
+            all_content_ids.update(content_ids.itervalues())
+
+        cells = self._store.read_published_cells(all_cell_ids) if all_cell_ids else {}
+        contents = self._store.read_published_contents(all_content_ids) if all_content_ids else {}
+        for block_version, (cell_ids, content_ids) in ids.iteritems():
+            for name, rID in cell_ids.iteritems():
+                if name in content_ids:
+                    cid = contents[content_ids[name]]
+                else:
+                    cid = None  # Virtual resource
+                result[block_version][name] = Resource(cells[rID], cid)
         return result
 
     def get_published_min_refs(self, references):
         '''returns the minimum information required to perform a compatibility check for those
-        references. This method is currently used just by CompatibilityClosureBuilder
+        references. This method is currently used just by CompatibilityClosureBuilder, once
+        per frontier wave, so the whole frontier is resolved with a constant number of reads
 
         param references: {block_version: set(cell_names)}
         return: {block_version: {cell_name: (cell_id, content_id), root_id, [deps blockcellnames]}}
         '''
         result = defaultdict(dict)
+        # Whole blocks, so they are reused by the MemServerStore in the following waves
+        blocks = self._read_blocks(references, None)
+        ids = {}  # {block_version: (cell_ids, content_ids)}
+        all_cell_ids = set()
         for block_version, cell_names in references.iteritems():
-            try:
-                self.security.check_read_block(block_version.block)
-                block = self._store.read_block(block_version.block)
-                cell_ids = block.cells.get_ids(cell_names, block_version.time)
-                content_ids = block.contents.get_ids(cell_names, block_version.time)
-                cells = self._store.read_min_cells(cell_ids.values())
-                #This cells are {cellID: (rootID, dep_block_names)}
-                for cell_name, cell_id in cell_ids.iteritems():
-                    content_id = content_ids.get(cell_name)  # None if Virtual resource
-                    root_id, deps = cells.get(cell_id, (None, None))
-                    if root_id is not None:
-                        result[block_version][cell_name] = ((cell_id, content_id), root_id, deps)
-            except (ForbiddenException, NotInStoreException):
-                pass
+            block = blocks.get(block_version.block)
+            if block is None:
+                continue
+            cell_ids = block.cells.get_ids(cell_names, block_version.time)
+            content_ids = block.contents.get_ids(cell_names, block_version.time)
+            ids[block_version] = cell_ids, content_ids
+            all_cell_ids.update(cell_ids.itervalues())
 
+        cells = self._store.read_min_cells(all_cell_ids) if all_cell_ids else {}
+        #This cells are {cellID: (rootID, dep_block_names)}
+        for block_version, (cell_ids, content_ids) in ids.iteritems():
+            for cell_name, cell_id in cell_ids.iteritems():
+                content_id = content_ids.get(cell_name)  # None if Virtual resource
+                root_id, deps = cells.get(cell_id, (None, None))
+                if root_id is not None:
+                    result[block_version][cell_name] = ((cell_id, content_id), root_id, deps)
         return result
 
     def get_dep_table(self, block_version):
         self.security.check_read_block(block_version.block)
-        block = self._store.read_block(block_version.block)
-        table = block.dep_tables.find(block_version.time)
-        return table
+        return self._store.read_dep_table(block_version)
+
+    def get_block_closure(self, block_version):
+        '''BlockVersionGraph of the transitive dependencies of block_version'''
+        def build():
+            graph, _ = block_version_graph_build(self.get_dep_table, [block_version],
+                                                 BlockVersionTable())
+            return graph
+
+        graph = self._store.read_block_closure(block_version, build)
+        # Closures can be built in other request, check this user can read all the blocks
+        blocks = {version.block for version in graph.nodes}
+        if self.security.filter_read_blocks(blocks) != blocks:
+            return build()  # Raises as get_dep_table
+        return graph
+
+    def _read_blocks(self, references, tables):
+        '''{brl_block: Block} of the readable blocks of references, with only one read of
+        the permissions and one of the blocks, shared by all the versions of each block'''
+        brl_blocks = {block_version.block for block_version in references}
+        readable = self.security.filter_read_blocks(brl_blocks)
+        return self._store.read_blocks(readable, tables) if readable else {}
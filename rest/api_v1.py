@@ -1,4 +1,6 @@
 from biicode.server.api.bii_service import BiiService
+from biicode.server.find.finder_service import search_stats
+from biicode.server.utils.intern import names
 from biicode.common.model.symbolic.reference import References
 from biicode.common.model.symbolic.block_version import BlockVersion
 from biicode.common.model.brl.brl_block import BRLBlock
@@ -248,3 +250,13 @@ def require_auth(auth_user):
 @app.route('/ping', method="GET")
 def ping():
     raise HTTPResponse("pong", 200)
+
+
+@app.route('/cache_stats', method="GET")
+def cache_stats():
+    """Hit, miss and eviction counters of this worker caches and its find search counters,
+    for monitoring"""
+    stats = app.store.cache_stats()
+    stats["find_search"] = dict(search_stats)
+    stats["interned"] = names.stats()
+    return stats
@@ -12,6 +12,8 @@ from biicode.server.background.enqueuer import (register_publish,
                                                 register_get_version_delta_info,
                                                 register_user_action)
 
+MONITORING_ACTIONS = ("ping", "cache_stats")  # Not traced, only for monitoring
+
 
 class BiiUserTraceBottlePlugin(object):
     ''' The BiiUserTraceBottlePlugin plugin enqueue user accesses to rest api'''
@@ -26,7 +28,7 @@ class BiiUserTraceBottlePlugin(object):
             action_name = str(callback.__name__)
             description = ""
             # We store the bson data in description, amount of data is free in heroku addon!
-            if action_name != "ping":  # only for monitoring alive
+            if action_name not in MONITORING_ACTIONS:
                 client_user = request.headers.get('X-Client-Id', None)
                 auth_user = kwargs.get("auth_user", None)
                 client_token = request.headers.get('X-Client-Anonymous-Id', None)
@@ -43,7 +45,7 @@ class BiiUserTraceBottlePlugin(object):
 
             # Once the action was succeed, lets check achievements
             # (if didnt succeed an exception was raised)
-            if action_name != "ping":  # only for monitoring alive
+            if action_name not in MONITORING_ACTIONS:
                 _trace_achievement_action(action_name, description, auth_user or client_user,
                                           self.async_process)
             return rv
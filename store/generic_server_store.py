@@ -2,6 +2,8 @@ from biicode.common.exception import BiiStoreException
 from biicode.server.model.permissions.element_permissions import ElementPermissions
 from biicode.server.model.payment.user_subscription import UserSubscription,\
     FREE_PLAN_ID
+from biicode.server.model.block import Block
+from biicode.server.model.min_cell import MinCell
 
 
 class GenericServerStore(object):
@@ -11,12 +13,21 @@ class GenericServerStore(object):
 
     PUBLISHED_CELL_ST = 'published_cell'
     PUBLISHED_CONTENT_ST = 'published_content'
+    PUBLISHED_MIN_CELL_ST = 'published_min_cell'
     BLOCK_ST = 'block'
     USER_ST = 'user'
     COUNTERS_ST = 'counter'
     BLOCK_PERMISSIONS_ST = "block_permissions"
+    BLOCK_CHANGE_COUNTER_ST = "block_change_counter"
     USER_SUBSCRIPTION_ST = "user_subscription"
 
+    # LRUCache of immutable published data (min cells, content sizes, dep tables) shared by
+    # the MemServerStores of all the requests of the process. None disables it
+    immutable_cache = None
+
+    # LRUCache of FinderResults shared by the finds of the process. None disables it
+    find_result_cache = None
+
     def create_published_cells(self, values):
         '''Create published cells. Receives Cell objects'''
         return self.create_multi(values, GenericServerStore.PUBLISHED_CELL_ST)
@@ -33,10 +44,66 @@ class GenericServerStore(object):
         '''Reads published contents due a set of brls'''
         return self.read_multi(content_ids, GenericServerStore.PUBLISHED_CONTENT_ST)
 
-    def read_block(self, brl):
-        '''Reads block by brl'''
+    def upsert_published_min_cells(self, cells):
+        '''Writes the MinCell of the published cells. Upserted, a rolled back publication
+        doesn't delete them and its IDs are used again by the next one'''
+        min_cells = [MinCell.from_cell(cell) for cell in cells]
+        return self.upsert_multi(min_cells, GenericServerStore.PUBLISHED_MIN_CELL_ST)
+
+    def read_published_min_cells(self, ids):
+        '''{ID: MinCell} of the found ones'''
+        return self.read_multi(ids, GenericServerStore.PUBLISHED_MIN_CELL_ST)
+
+    def read_block(self, brl, tables=None, counter=None):
+        '''Reads block by brl.
+        Params:
+            tables: iterable of Block table keys (Block.SERIAL_TABLES). If specified only those
+                    tables are required, the others are not accessible in returned block.
+                    Stores that can't read partial blocks return the whole block
+            counter: block change counter of brl if the caller has just read it, so stores
+                     caching blocks don't read it again'''
+        return self.read(brl, GenericServerStore.BLOCK_ST)
+
+    def read_blocks(self, brls, tables=None):
+        '''Reads several blocks at once, returns {brl: Block} with the found ones.
+        Params:
+            tables: as in read_block'''
+        return self.read_multi(brls, GenericServerStore.BLOCK_ST)
+
+    def read_dep_table(self, block_version, counter=None):
+        '''BlockVersionTable of block_version. counter: as in read_block'''
+        block = self.read_block(block_version.block, [Block.SERIAL_DEPS_TABLE], counter)
+        return block.dep_tables.find(block_version.time)
+
+    def read_block_for_update(self, brl):
+        '''Reads the whole block to modify it (publish). Never served from a cache, as the
+        returned object is going to be changed'''
         return self.read(brl, GenericServerStore.BLOCK_ST)
 
+    def read_block_change_counter(self, brl_block):
+        '''Counter of changes of brl_block, only stores caching blocks keep the counters'''
+        return 0
+
+    def read_block_change_counters(self, brl_blocks):
+        '''{brl_block: counter} of the blocks with a counter, 0 for the others'''
+        return {}
+
+    def read_block_closure(self, block_version, build_method):
+        '''BlockVersionGraph with the transitive dependencies of block_version. Computed by
+        build_method, stores used by FIND can reuse them'''
+        return build_method()
+
+    def bump_block_change_counter(self, brl_block):
+        '''Notifies that brl_block has changed (published or deleted), so cached copies of it
+        are stale. Nothing to do by default, only stores caching blocks keep the counters'''
+        pass
+
+    def read_block_delta(self, brl, time):
+        '''Reads the BlockDelta of the version "time" of block brl.
+        Returns None if that version doesn't exist'''
+        deltas = self.read_block(brl, [Block.SERIAL_DELTAS]).deltas
+        return deltas[time] if 0 <= time < len(deltas) else None
+
     def create_block(self, value, private=False):
         '''Insert a block. Value is a Block instance'''
         # Create default permissions
@@ -74,6 +141,9 @@ class GenericServerStore(object):
         '''Deletes edition cell due the brls'''
         return self.delete_multi(ids, GenericServerStore.PUBLISHED_CELL_ST)
 
+    def delete_published_min_cells(self, ids):
+        return self.delete_multi(ids, GenericServerStore.PUBLISHED_MIN_CELL_ST)
+
     def delete_published_contents(self, ids):
         '''Deletes edition content due the brl'''
         return self.delete_multi(ids, GenericServerStore.PUBLISHED_CONTENT_ST)
@@ -112,6 +182,14 @@ class GenericServerStore(object):
         ret = self.read(brl_block, GenericServerStore.BLOCK_PERMISSIONS_ST)
         return ret
 
+    def read_blocks_permissions(self, brl_blocks):
+        '''Gets {brl_block: Permissions} of the found ones'''
+        return self.read_multi(brl_blocks, GenericServerStore.BLOCK_PERMISSIONS_ST)
+
+    def cache_stats(self):
+        '''Hit, miss and eviction counters of the store caches, for monitoring'''
+        return {}
+
     # ************ Counts ***********
     def block_count(self):
         """Get the num of blocks"""
@@ -1,18 +1,45 @@
+from bson import BSON
 from biicode.common.store.mem_store import MemStore
+from biicode.common.utils.serializer import serialize
 from biicode.server.store.generic_server_store import GenericServerStore
-from biicode.common.model.cells import SimpleCell
+from biicode.server.model.min_cell import MinCell
+from biicode.server.conf import BII_IMMUTABLE_CACHE_IDS_MAX_AGE
+
+
+# Kinds of elements in the shared immutable cache
+MIN_CELL = "min_cell"
+CONTENT_SIZE = "content_size"
+DEP_TABLE = "dep_table"
+BLOCK_CLOSURE = "block_closure"
+
+
+def _size(value):
+    '''Size in bytes of the elements in the shared immutable cache, approximated with the
+    size of their BSON serialization, as the block cache does'''
+    return len(BSON.encode({"v": serialize(value)}))
+
+
+def _closure_size(graph, counters):
+    nodes = list(graph.nodes)
+    return _size((nodes, [list(graph.neighbours(node)) for node in nodes], counters.items()))
 
 
 class MemServerStore(MemStore, GenericServerStore):
+    '''Per request store (FIND), keeps in memory what is read from the wrapped store.
+    Published min cells, content sizes, dep tables and block closures are also kept in the
+    immutable_cache of the wrapped store, shared by all the requests. Min cells and content
+    sizes expire, as the IDs of a rolled back publication are used again'''
 
     def _init_holders(self):
         #NOTE: Do not rename dicts, they MUST match the method name
         self.published_cell = {}
         self.published_content = {}
+        self.published_min_cell = {}
         self.edition_cell = {}
         self.edition_content = {}
         self.hive = {}
         self.block = {}
+        self.block_projections = {}  # {(brl_block, frozenset(tables)): partial Block}
         self.user = {}
         self.branches = {}
         self.counters = {"users": 0}
@@ -21,6 +48,9 @@ class MemServerStore(MemStore, GenericServerStore):
         self.user_subscription = {}
         self.min_cells = {}  # {ID: (rootID, [deps_block_cell_names]
         self.content_sizes = {}  # For catching content_sizes
+        self.dep_tables = {}  # {block_version: BlockVersionTable}
+        self.block_counters = {}  # {brl_block: counter when its dep tables or closures were read}
+        self.block_closures = {}  # {block_version: BlockVersionGraph}
 
     def read_min_cells(self, ids):
         '''reads cells and cache only the minimum information necessary to compute compatibility
@@ -28,13 +58,19 @@ class MemServerStore(MemStore, GenericServerStore):
         This funcion is only called by RefTranslator.get_published_min_refs, that is only called
         by CompatibilityClosureBuilder, only in FIND.
         Thus, FIND MUST always use a MemServerStore'''
-        missing_ids = set(ids).difference(self.min_cells)
-        cells = self._store.read_published_cells(missing_ids)
-        for id_, cell in cells.iteritems():
-            if isinstance(cell, SimpleCell):
-                self.min_cells[id_] = (cell.root, list(cell.dependencies.targets))
-            else:
-                self.min_cells[id_] = (cell.root, list(cell.resource_leaves))
+        ids = list(ids)
+        missing_ids = self._from_shared(MIN_CELL, self.min_cells, ids)
+        if missing_ids:
+            # All the missing ones prefetched with one read of the precomputed min cells
+            read = {id_: min_cell.value for id_, min_cell
+                    in self._store.read_published_min_cells(missing_ids).iteritems()}
+            missing_ids.difference_update(read)
+            if missing_ids:  # Not migrated yet, reduce the whole cells
+                cells = self._store.read_published_cells(missing_ids)
+                read.update((id_, MinCell.from_cell(cell).value)
+                            for id_, cell in cells.iteritems())
+            self.min_cells.update(read)
+            self._to_shared(MIN_CELL, read, _size)
         result = {}
         for id_ in ids:
             try:
@@ -43,6 +79,140 @@ class MemServerStore(MemStore, GenericServerStore):
                 pass
         return result
 
+    def read_dep_table(self, block_version, counter=None):
+        '''Shared dep tables are validated with the block change counter, as DEV versions
+        are published again with the same time'''
+        try:
+            return self.dep_tables[block_version]
+        except KeyError:
+            pass
+        if self._store:
+            read_method = self._store.read_dep_table
+        else:
+            read_method = lambda version, _: GenericServerStore.read_dep_table(self, version)
+
+        shared_cache = self._shared_cache
+        if shared_cache is not None:
+            if counter is None:
+                counter = self._store.read_block_change_counter(block_version.block)
+            # Read before the table, so closures built from it can be validated later
+            self.block_counters.setdefault(block_version.block, counter)
+            key = (DEP_TABLE, block_version)
+            table = shared_cache.get(key, counter)
+            if table is None:
+                # The counter is passed, so the block cache doesn't read it again
+                table = read_method(block_version, counter)
+                if table is not None:
+                    shared_cache.set(key, table, _size(table), counter)
+        else:
+            table = read_method(block_version, counter)
+        self.dep_tables[block_version] = table
+        return table
+
+    def read_block_closure(self, block_version, build_method):
+        '''Closures are reused in the request and shared with other requests. Shared ones are
+        validated with the change counters of all their blocks, read with their dep tables'''
+        try:
+            return self.block_closures[block_version]
+        except KeyError:
+            pass
+        shared_cache = self._shared_cache
+        key = (BLOCK_CLOSURE, block_version)
+        graph = None
+        if shared_cache is not None:
+            cached = shared_cache.get(key)
+            if cached is not None:
+                cached_graph, counters = cached
+                current = self._store.read_block_change_counters(counters.keys())
+                if all(current.get(brl, 0) == counter for brl, counter in counters.iteritems()):
+                    graph = cached_graph
+                    # Its dep tables are not read, but the counters validate it as well
+                    for brl, counter in counters.iteritems():
+                        self.block_counters.setdefault(brl, counter)
+                else:
+                    shared_cache.delete(key)
+        if graph is None:
+            graph = build_method()
+            if shared_cache is not None:
+                blocks = {version.block for version in graph.nodes}
+                if blocks.issubset(self.block_counters):
+                    counters = {brl: self.block_counters[brl] for brl in blocks}
+                    shared_cache.set(key, (graph, counters), _closure_size(graph, counters))
+        self.block_closures[block_version] = graph
+        return graph
+
+    def read_block_change_counters(self, brl_blocks):
+        '''Not kept, they are read to validate shared data'''
+        return self._store.read_block_change_counters(brl_blocks) if self._store else {}
+
+    def read_block(self, brl, tables=None, counter=None):
+        '''Blocks read in this request are reused, partial ones only for the same tables.
+        They are read with the read_block of the wrapped store, so its block cache and
+        projections are used'''
+        try:
+            return self.block[brl]  # A whole block serves any tables
+        except KeyError:
+            pass
+        if not self._store:
+            return GenericServerStore.read_block(self, brl)
+        if tables is None:
+            block = self.block[brl] = self._store.read_block(brl, None, counter)
+            return block
+        key = brl, frozenset(tables)
+        try:
+            return self.block_projections[key]
+        except KeyError:
+            block = self._store.read_block(brl, tables, counter)
+            self.block_projections[key] = block
+            return block
+
+    def read_blocks(self, brls, tables=None):
+        '''Blocks already read in this request are reused, the missing ones are read at once.
+        Partial blocks are not kept, they can't serve other reads'''
+        if tables is not None:
+            return self._read_missing(self.block, brls,
+                                      lambda missing: self._store.read_blocks(missing, tables),
+                                      keep=False)
+        return self._read_missing(self.block, brls, self._store and self._store.read_blocks)
+
+    def read_blocks_permissions(self, brl_blocks):
+        return self._read_missing(self.block_permissions, brl_blocks,
+                                  self._store and self._store.read_blocks_permissions)
+
+    def _read_missing(self, holder, ids, read_method, keep=True):
+        result = {id_: holder[id_] for id_ in ids if id_ in holder}
+        missing = set(ids).difference(result)
+        if missing and self._store:
+            read = read_method(missing)
+            if keep:
+                holder.update(read)
+            result.update(read)
+        return result
+
+    @property
+    def _shared_cache(self):
+        return self._store.immutable_cache if self._store else None
+
+    def _from_shared(self, kind, holder, ids):
+        '''Moves to holder the shared elements not read yet in this request.
+        Returns the set of ids still missing'''
+        missing_ids = set(ids).difference(holder)
+        shared_cache = self._shared_cache
+        if shared_cache is not None:
+            for id_ in list(missing_ids):
+                value = shared_cache.get((kind, id_))
+                if value is not None:
+                    holder[id_] = value
+                    missing_ids.discard(id_)
+        return missing_ids
+
+    def _to_shared(self, kind, values, size_method):
+        shared_cache = self._shared_cache
+        if shared_cache is not None:
+            for id_, value in values.iteritems():
+                shared_cache.set((kind, id_), value, size_method(value),
+                                 max_age=BII_IMMUTABLE_CACHE_IDS_MAX_AGE)
+
     def __getattr__(self, name):
         if self._store:
             return getattr(self._store, name)
@@ -51,9 +221,11 @@ class MemServerStore(MemStore, GenericServerStore):
     ############ Get content sizes ################
     def read_content_sizes(self, content_ids):
         """Cached content sizes. self._store MUST EXIST"""
-        missing_ids = set(content_ids).difference(self.content_sizes)
-        content_sizes = self._store.read_content_sizes(missing_ids)
-        # Assign to cached collection
-        self.content_sizes.update(content_sizes)
+        missing_ids = self._from_shared(CONTENT_SIZE, self.content_sizes, content_ids)
+        if missing_ids:
+            content_sizes = self._store.read_content_sizes(missing_ids)
+            # Assign to cached collection
+            self.content_sizes.update(content_sizes)
+            self._to_shared(CONTENT_SIZE, content_sizes, _size)
         # return cached
         return {content_id: self.content_sizes[content_id] for content_id in content_ids}
@@ -1,15 +1,195 @@
-from biicode.server.utils.cache import MemCachedCollection
+from uuid import uuid4
+from biicode.server.utils.cache import MemCachedCollection, cache_key
+from biicode.server.store.generic_server_store import GenericServerStore
+from biicode.server.store.mongo_server_store import MongoServerStore
+from biicode.server.utils import update_if_current
+from biicode.server.conf import (BII_MEMCACHE_BLOCK_PERMISSIONS_EXPIRE_MINUTES,
+                                 BII_MEMCACHE_SUBS_PERMISSIONS_EXPIRE_MINUTES,
+                                 BII_MEMCACHE_USER_EXPIRE_MINUTES)
 
 
 IP_ACCESSES = "ip"
 
 
 class MemCacheProxyStore(object):
+    '''Proxy of a server store with a memcached read-through cache for the collections read
+    much more often than written. Writes through the proxy invalidate the cached elements.
+    Published cells and contents are cached by the store itself (PublishedCache).
+
+    Each cached element has a version key, with a random token changed by every write. The
+    token is read before the store and cached with the element, and cached elements with
+    other token are stale. So a read that races with a write can't leave the old element
+    cached after the invalidation'''
 
     def __init__(self, store, cache_client):
         self.store = store
         self.cache_client = cache_client
         self.ip_mc_collection = MemCachedCollection(cache_client, IP_ACCESSES)
 
+        # {collection: expire seconds}
+        self._expire_seconds = {
+            GenericServerStore.BLOCK_PERMISSIONS_ST:
+                BII_MEMCACHE_BLOCK_PERMISSIONS_EXPIRE_MINUTES.total_seconds(),
+            GenericServerStore.USER_SUBSCRIPTION_ST:
+                BII_MEMCACHE_SUBS_PERMISSIONS_EXPIRE_MINUTES.total_seconds(),
+            GenericServerStore.USER_ST: BII_MEMCACHE_USER_EXPIRE_MINUTES.total_seconds(),
+        }
+        self._mc_collections = {collection: MemCachedCollection(cache_client, collection)
+                                for collection in self._expire_seconds}
+
     def __getattr__(self, name):
         return getattr(self.store, name)
+
+    ############ Read through ################
+    def read_user(self, brl_user):
+        return self._read(brl_user, GenericServerStore.USER_ST, self.store.read_user)
+
+    def read_user_subscription(self, brl_user):
+        return self._read(brl_user, GenericServerStore.USER_SUBSCRIPTION_ST,
+                          self.store.read_user_subscription)
+
+    def read_block_permissions(self, brl_block):
+        return self._read(brl_block, GenericServerStore.BLOCK_PERMISSIONS_ST,
+                          self.store.read_block_permissions)
+
+    def read_blocks_permissions(self, brl_blocks):
+        return self._read_multi(brl_blocks, GenericServerStore.BLOCK_PERMISSIONS_ST,
+                                self.store.read_blocks_permissions)
+
+    ############ Invalidation ################
+    def update_user(self, user):
+        return self._write(GenericServerStore.USER_ST, [user.ID], self.store.update_user, user)
+
+    def update_user_subscription(self, user_subscription):
+        return self._write(GenericServerStore.USER_SUBSCRIPTION_ST, [user_subscription.ID],
+                           self.store.update_user_subscription, user_subscription)
+
+    def update_block_permissions(self, permissions):
+        return self._write(GenericServerStore.BLOCK_PERMISSIONS_ST, [permissions.ID],
+                           self.store.update_block_permissions, permissions)
+
+    def upsert_block_permissions(self, permissions):
+        return self._write(GenericServerStore.BLOCK_PERMISSIONS_ST, [permissions.ID],
+                           self.store.upsert_block_permissions, permissions)
+
+    def delete_block(self, brl_block):
+        return self._write(GenericServerStore.BLOCK_PERMISSIONS_ST, [brl_block],
+                           self.store.delete_block, brl_block)
+
+    def delete_block_permissions(self, brl_block):
+        return self._write(GenericServerStore.BLOCK_PERMISSIONS_ST, [brl_block],
+                           self.store.delete_block_permissions, brl_block)
+
+    def update(self, value, collection, upsert=False, is_serialized=False):
+        return self._write(collection, [self._value_id(value, is_serialized)],
+                           self.store.update, value, collection, upsert, is_serialized)
+
+    def upsert(self, value, collection, is_serialized=False):
+        return self.update(value, collection, upsert=True, is_serialized=is_serialized)
+
+    def update_multi(self, values, collection, upsert=False, is_serialized=False):
+        ids = [self._value_id(value, is_serialized) for value in values]
+        return self._write(collection, ids, self.store.update_multi, values, collection, upsert,
+                           is_serialized)
+
+    def upsert_multi(self, values, collection, is_serialized=False):
+        return self.update_multi(values, collection, upsert=True, is_serialized=is_serialized)
+
+    def update_field(self, collection, obj_id, field_name, value):
+        return self._write(collection, [obj_id], self.store.update_field, collection, obj_id,
+                           field_name, value)
+
+    def delete(self, value, collection):
+        return self._write(collection, [value], self.store.delete, value, collection)
+
+    def delete_multi(self, values, collection):
+        return self._write(collection, values, self.store.delete_multi, values, collection)
+
+    ############ Aux methods ################
+    def _read(self, object_id, collection, read_method):
+        mc_collection = self._mc_collections[collection]
+        key = cache_key(object_id)
+        docs, versions = self._cached(mc_collection, [key])
+        if key in docs:
+            return self._deserialize(docs[key], collection)
+        obj = read_method(object_id)
+        self._cache(mc_collection, {key: obj}, versions, self._expire_seconds[collection])
+        return obj
+
+    def _read_multi(self, object_ids, collection, read_method):
+        mc_collection = self._mc_collections[collection]
+        keys = {cache_key(object_id): object_id for object_id in object_ids}
+        docs, versions = self._cached(mc_collection, keys.keys())
+        result = {keys[key]: self._deserialize(doc, collection) for key, doc in docs.iteritems()}
+        missing = [object_id for key, object_id in keys.iteritems() if key not in docs]
+        if missing:
+            objs = read_method(missing)
+            self._cache(mc_collection, {cache_key(object_id): obj
+                                        for object_id, obj in objs.iteritems()},
+                        versions, self._expire_seconds[collection])
+            result.update(objs)
+        return result
+
+    @staticmethod
+    def _version_key(key):
+        return key + "#version"
+
+    def _cached(self, mc_collection, keys):
+        '''Reads the keys and their versions with one get_multi.
+        Returns ({key: doc} of the current cached elements, {key: version} of the others)'''
+        version_keys = {key: self._version_key(key) for key in keys}
+        found = mc_collection.get_multi(list(keys) + version_keys.values())
+        docs, versions = {}, {}
+        for key in keys:
+            version = found.get(version_keys[key])
+            if version is None:
+                # Evicted or never written. A new token, no cached element can match it
+                version = uuid4().hex
+                if not mc_collection.add(version_keys[key], version):
+                    version = None  # Concurrent read or write, not cached this time
+            else:
+                cached = found.get(key)
+                if cached is not None and cached[0] == version:
+                    docs[key] = cached[1]
+                    continue
+            versions[key] = version
+        return docs, versions
+
+    def _cache(self, mc_collection, objs, versions, expire_seconds):
+        '''Caches {key: obj} read from the store with the versions read before'''
+        mapping = {key: (versions[key], self._serialize(obj))
+                   for key, obj in objs.iteritems() if versions.get(key) is not None}
+        if mapping:
+            mc_collection.set_multi(mapping, expire_seconds)
+
+    def _write(self, collection, object_ids, write_method, *args):
+        try:
+            return write_method(*args)
+        finally:
+            # Also when the write fails (ex: object not current), so it's read again
+            mc_collection = self._mc_collections.get(collection)
+            if mc_collection is not None and object_ids:
+                keys = [cache_key(object_id) for object_id in object_ids]
+                # New versions make stale the elements being cached by concurrent reads
+                mc_collection.set_multi({self._version_key(key): uuid4().hex for key in keys})
+                mc_collection.delete_multi(keys)
+
+    @staticmethod
+    def _value_id(value, is_serialized):
+        return value['_id'] if is_serialized else value.ID
+
+    @staticmethod
+    def _serialize(obj):
+        doc = obj.serialize()
+        txn_k = update_if_current.SERIAL_TXN_COUNTER_KEY  # Requires update_if_current check
+        if hasattr(obj, txn_k):
+            doc[txn_k] = getattr(obj, txn_k)
+        return doc
+
+    @staticmethod
+    def _deserialize(doc, collection):
+        obj = MongoServerStore.deserializer[collection].deserialize(doc)
+        txn_k = update_if_current.SERIAL_TXN_COUNTER_KEY
+        if txn_k in doc:
+            setattr(obj, txn_k, doc[txn_k])
+        return obj
@@ -1,20 +1,24 @@
 from biicode.server.model.user import User
 from biicode.server.model.block import Block
+from biicode.server.model.min_cell import MinCell
 from biicode.common.model.content import ContentDeserializer
 from biicode.common.model.cells import CellDeserializer
 from biicode.common.model.id import ID
 from biicode.server.store.mongo_store import MongoStore
 from biicode.server.store.generic_server_store import GenericServerStore
 from biicode.common.model.brl.brl_block import BRLBlock
+from biicode.common.model.block_delta import BlockDelta
 from biicode.server.exception import BiiPendingTransactionException
 from biicode.server.model.permissions.element_permissions import ElementPermissions
 from biicode.server.model.payment.user_subscription import UserSubscription
+from bson import BSON
 
 
 class MongoServerStore(MongoStore, GenericServerStore):
     deserializer = {
         GenericServerStore.PUBLISHED_CELL_ST: CellDeserializer(ID),
         GenericServerStore.PUBLISHED_CONTENT_ST: ContentDeserializer(ID),
+        GenericServerStore.PUBLISHED_MIN_CELL_ST: MinCell,
         GenericServerStore.BLOCK_ST: Block,
         GenericServerStore.USER_ST: User,
         GenericServerStore.COUNTERS_ST: None,
@@ -22,11 +26,151 @@ class MongoServerStore(MongoStore, GenericServerStore):
         GenericServerStore.USER_SUBSCRIPTION_ST: UserSubscription
     }
 
-    def __init__(self, connection, databasename=None):
+    def __init__(self, connection, databasename=None, block_cache=None, published_caches=None,
+                 immutable_cache=None, find_result_cache=None):
         '''
         connection: MongoClient, can be get from MongoStore.makeConnection
+        block_cache: LRUCache of read blocks and block projections, shared by all the requests
+                     of the process. Cached blocks are validated with the block change counter,
+                     so a hit still costs the (small) read of the counter, but not the transfer
+                     and deserialization of the block. They are read only
+        published_caches: {collection: PublishedCache} for published cells and contents
+        immutable_cache: LRUCache used by the MemServerStores wrapping this store (FIND)
+        find_result_cache: LRUCache of FinderResults, used by FindService
         '''
         MongoStore.__init__(self, connection, databasename)
+        self.block_cache = block_cache
+        self._block_projections = set()  # frozensets of tables (None whole block) read
+        self.published_caches = published_caches or {}
+        self.immutable_cache = immutable_cache
+        self.find_result_cache = find_result_cache
+
+    def read_multi(self, object_ids, collection, fields=None, deserializer=None):
+        cache = self.published_caches.get(collection)
+        if cache is None or fields is not None or deserializer is not None:
+            return MongoStore.read_multi(self, object_ids, collection, fields, deserializer)
+        object_ids = list(object_ids)
+        result = cache.get_multi(object_ids)
+        missing = [object_id for object_id in object_ids if object_id not in result]
+        if missing:
+            read = MongoStore.read_multi(self, missing, collection)
+            cache.set_multi(read.itervalues())
+            result.update(read)
+        return result
+
+    def delete_multi(self, values, collection):
+        '''Also used by rollBackBlockTransaction with serialized IDs'''
+        try:
+            MongoStore.delete_multi(self, values, collection)
+        finally:
+            cache = self.published_caches.get(collection)
+            if cache is not None:
+                cache.delete_multi(values)
+
+    def read_block(self, brl, tables=None, counter=None):
+        '''Reads block by brl, if tables is specified only those tables are fetched.
+        With block_cache, the block (or the projection of those tables) can be shared with
+        other requests, so it is read only (see Block.set_read_only).
+        counter: block change counter already read by the caller, if any'''
+        if self.block_cache is None:
+            if tables is None:
+                return GenericServerStore.read_block(self, brl)
+            return self.read(brl, GenericServerStore.BLOCK_ST, fields=self._block_fields(tables))
+
+        if counter is None:
+            counter = self.read_block_change_counter(brl)
+        key = self._block_cache_key(brl, tables)
+        block = self.block_cache.get(key, counter)
+        if block is None:
+            fields = self._block_fields(tables) if tables is not None else None
+            doc = self.read(brl, GenericServerStore.BLOCK_ST, fields=fields, deserializer=False)
+            block = self._cache_block(key, doc, counter)
+        return block
+
+    def read_blocks(self, brls, tables=None):
+        '''Reads several blocks with one query (plus one for the change counters if cached)'''
+        fields = self._block_fields(tables) if tables is not None else None
+        if self.block_cache is None:
+            return self.read_multi(brls, GenericServerStore.BLOCK_ST, fields=fields)
+
+        counters = self.read_block_change_counters(brls)
+        result = {}
+        missing = {}  # {brl: cache key}
+        for brl in set(brls):
+            key = self._block_cache_key(brl, tables)
+            block = self.block_cache.get(key, counters.get(brl, 0))
+            if block is not None:
+                result[brl] = block
+            else:
+                missing[brl] = key
+        if missing:
+            docs = self.read_multi(missing, GenericServerStore.BLOCK_ST, fields=fields,
+                                   deserializer=False)
+            for brl, doc in docs.iteritems():
+                result[brl] = self._cache_block(missing[brl], doc, counters.get(brl, 0))
+        return result
+
+    def _block_cache_key(self, brl, tables):
+        '''Whole blocks and each projection (tables) are cached apart, the hot read only
+        endpoints always read the same few projections'''
+        projection = frozenset(tables) if tables is not None else None
+        self._block_projections.add(projection)
+        return brl, projection
+
+    def _cache_block(self, key, doc, counter):
+        block = Block.deserialize(doc)
+        block.set_read_only()  # Shared by all the requests
+        # Size approximated with the BSON document size
+        self.block_cache.set(key, block, len(BSON.encode(doc)), counter)
+        return block
+
+    @staticmethod
+    def _block_fields(tables):
+        fields = [Block.SERIAL_NUMERIC_ID_KEY, Block.SERIAL_CELLS_COUNTER,
+                  Block.SERIAL_CONTENT_COUNTER]
+        fields.extend(tables)
+        return fields
+
+    def read_block_delta(self, brl, time):
+        '''Reads only the BlockDelta of version "time", slicing the deltas list in database'''
+        if time < 0:
+            return None
+        fields = {Block.SERIAL_NUMERIC_ID_KEY: 1,
+                  Block.SERIAL_DELTAS: {"$slice": [time, 1]}}
+        doc = self.read(brl, GenericServerStore.BLOCK_ST, fields=fields, deserializer=False)
+        deltas = doc.get(Block.SERIAL_DELTAS)
+        return BlockDelta.deserialize(deltas[0]) if deltas else None
+
+    def read_block_change_counter(self, brl_block):
+        dbcol = self.db[GenericServerStore.BLOCK_CHANGE_COUNTER_ST]
+        doc = dbcol.find_one({'_id': brl_block.serialize()})
+        return doc['seq'] if doc else 0
+
+    def read_block_change_counters(self, brl_blocks):
+        '''{brl_block: counter} of the blocks that have a counter (0 otherwise)'''
+        dbcol = self.db[GenericServerStore.BLOCK_CHANGE_COUNTER_ST]
+        ids = [brl_block.serialize() for brl_block in brl_blocks]
+        return {BRLBlock(doc['_id']): doc['seq'] for doc in dbcol.find({'_id': {"$in": ids}})}
+
+    def bump_block_change_counter(self, brl_block):
+        '''Must be called once the block change is written, otherwise a concurrent read
+        could cache the old block with the new counter'''
+        dbcol = self.db[GenericServerStore.BLOCK_CHANGE_COUNTER_ST]
+        dbcol.update({'_id': brl_block.serialize()}, {"$inc": {'seq': 1}}, upsert=True)
+        if self.block_cache is not None:
+            for projection in self._block_projections:
+                self.block_cache.delete((brl_block, projection))
+
+    def cache_stats(self):
+        stats = {collection: cache.stats()
+                 for collection, cache in self.published_caches.iteritems()}
+        if self.block_cache is not None:
+            stats["block"] = self.block_cache.stats()
+        if self.immutable_cache is not None:
+            stats["immutable"] = self.immutable_cache.stats()
+        if self.find_result_cache is not None:
+            stats["find_result"] = self.find_result_cache.stats()
+        return stats
 
     def read_user_by_email(self, email):
         '''Reads user by email'''
@@ -72,6 +216,7 @@ class MongoServerStore(MongoStore, GenericServerStore):
         return {
                 GenericServerStore.PUBLISHED_CELL_ST: ID,
                 GenericServerStore.PUBLISHED_CONTENT_ST: ID,
+                GenericServerStore.PUBLISHED_MIN_CELL_ST: ID,
                 GenericServerStore.BLOCK_ST: BRLBlock,
                 GenericServerStore.BLOCK_PERMISSIONS_ST: BRLBlock,
                 }[collection]
@@ -102,7 +247,7 @@ class MongoServerStore(MongoStore, GenericServerStore):
         brls = dbcol.find({}, {"_id": 1})  # Iterator in results
         for ret_brl_block in brls:  # Its an iterator too
             brl_block = BRLBlock(ret_brl_block["_id"])
-            the_block = self.read_block(brl_block)
+            the_block = self.read_block(brl_block, [Block.SERIAL_DELTAS])
             last_delta = the_block.last_delta
             if last_delta:
                 last_pub_date = last_delta.datetime
@@ -1,9 +1,14 @@
 from pymongo.mongo_client import MongoClient
 from pymongo.errors import OperationFailure, DuplicateKeyError
+try:
+    from pymongo.errors import BulkWriteError
+except ImportError:  # pymongo < 2.7, update_multi doesn't use bulk operations
+    BulkWriteError = None
 from biicode.server.exception import (BiiStoreException, BiiPendingTransactionException,
                                      MongoNotCurrentObjectException,
                                      MongoNotFoundUpdatingException,
-                                     MongoStoreException, MongoUpdateException)
+                                     MongoStoreException, MongoUpdateException,
+                                     MongoBulkNotCurrentException, MongoBulkNotFoundException)
 from biicode.server.store.generic_server_store import GenericServerStore
 from biicode.server.utils import update_if_current
 import traceback
@@ -15,6 +20,14 @@ from copy import copy
 import os
 
 
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+
+def _hashable(serial_id):
+    '''Serialized IDs are lists'''
+    return tuple(serial_id) if isinstance(serial_id, list) else serial_id
+
+
 class MongoStore(object):
 
     def __init__(self, connection, databasename):
@@ -51,14 +64,15 @@ class MongoStore(object):
         pass
 
     def read(self, object_id, collection, fields=None, deserializer=None):
-        '''fields: if specified only this fields are fetched
+        '''fields: if specified only this fields are fetched. It can also be a dict with a
+                   mongo projection, ex: {"dl": {"$slice": -1}}
            deserializer: if specified use this instead of generic collection deserializer
                          if False, dict is returned'''
         logger.debug("**FIND ONE: %s - %s" % (str(collection), str(object_id)))
         dbcol = self.db[collection]
         s = serialize(object_id)
 
-        projection = dict([(name, 1) for name in fields]) if fields else None
+        projection = self._projection(fields)
         doc = dbcol.find_one({"_id": s}, projection)
 
         if not doc:
@@ -74,13 +88,14 @@ class MongoStore(object):
         return obj
 
     def read_multi(self, object_ids, collection, fields=None, deserializer=None):
-        '''fields: if specified only this fields are fetched
+        '''fields: if specified only this fields are fetched. It can also be a dict with a
+                   mongo projection, ex: {"dl": {"$slice": -1}}
            deserializer: if specified use this instead of generic collection deserializer
                          if False, dict is returned'''
         dbcol = self.db[collection]
         ids = [a.serialize() for a in object_ids]
 
-        projection = dict([(name, 1) for name in fields]) if fields else None
+        projection = self._projection(fields)
 
         cursor = dbcol.find({"_id": {"$in": ids}}, projection)
         des_key = self.getDeserializerMulti(collection)
@@ -89,6 +104,14 @@ class MongoStore(object):
         result = {des_key.deserialize(doc["_id"]): deserializer_method(doc) for doc in cursor}
         return result
 
+    @staticmethod
+    def _projection(fields):
+        if not fields:
+            return None
+        if isinstance(fields, dict):
+            return fields
+        return dict([(name, 1) for name in fields])
+
     def _get_deserializer_method(self, deserializer, collection):
         if deserializer is None:
             return self.getDeserializer(collection).deserialize
@@ -182,9 +205,101 @@ class MongoStore(object):
         return self.db.command("dbstats")
 
     def update_multi(self, values, collection, upsert=False, is_serialized=False):
-        for value in values:
-            # MongoDB update Modifies an existing document
-            self.update(value, collection, upsert, is_serialized)
+        '''Writes all the values with one unordered bulk operation. As in update, values with
+        update_if_current check are only written if they are current.
+        Raises MongoBulkNotCurrentException (a MongoNotCurrentObjectException) if some value
+        was not current, or MongoBulkNotFoundException otherwise, with the IDs of the not
+        current and not found values, once all the other values are written.
+        If the same object is given more than once, its updates depend on the previous ones
+        (txn counter), so values are updated one by one, in order, as update does. Also
+        without bulk operations (pymongo < 2.7)'''
+        values = list(values)
+        if not values:
+            return
+        serials = [dict(value) if is_serialized else value.serialize() for value in values]
+        if (not self._has_bulk_operations(collection) or
+                len({_hashable(serial['_id']) for serial in serials}) < len(serials)):
+            self._update_each(values, [serial['_id'] for serial in serials], collection, upsert,
+                              is_serialized)
+            return
+
+        txn_k = update_if_current.SERIAL_TXN_COUNTER_KEY
+        bulk = self.db[collection].initialize_unordered_bulk_op()
+        ids = []
+        checked = {}  # {index: new txn counter} of values with update_if_current check
+        for index, (value, serial) in enumerate(zip(values, serials)):
+            query = {'_id': serial['_id']}
+            if hasattr(value, txn_k):
+                query[txn_k] = getattr(value, txn_k)
+                serial[txn_k] = update_if_current.inc_txn_counter(query[txn_k])
+                setattr(value, txn_k, serial[txn_k])
+                checked[index] = serial[txn_k]
+            ids.append(serial.pop('_id'))
+            operation = bulk.find(query)
+            if upsert:
+                operation = operation.upsert()
+            operation.update_one({"$set": serial})
+
+        try:
+            result = bulk.execute()
+        except BulkWriteError as e:
+            result = e.details
+        failed = self._bulk_failed_indexes(collection, result, ids, checked)
+        self._raise_not_updated([ids[index] for index in failed if index in checked],
+                                [ids[index] for index in failed if index not in checked])
+
+    def _has_bulk_operations(self, collection):
+        return hasattr(self.db[collection], "initialize_unordered_bulk_op")
+
+    def _update_each(self, values, ids, collection, upsert, is_serialized):
+        '''update_multi with one update for each value, in order'''
+        not_current, not_found = [], []
+        for value, id_ in zip(values, ids):
+            try:
+                self.update(value, collection, upsert, is_serialized)
+            except MongoNotCurrentObjectException:
+                not_current.append(id_)
+            except MongoNotFoundUpdatingException:
+                not_found.append(id_)
+            except DuplicateKeyError:
+                if not upsert:
+                    raise
+                not_current.append(id_)  # Upsert of a not current value
+        self._raise_not_updated(not_current, not_found)
+
+    @staticmethod
+    def _raise_not_updated(not_current, not_found):
+        if not_current or not_found:
+            exception = MongoBulkNotCurrentException if not_current else MongoBulkNotFoundException
+            raise exception("Objects not updated, not current: %s, not found: %s"
+                            % (not_current, not_found), not_current, not_found)
+
+    def _bulk_failed_indexes(self, collection, result, ids, checked):
+        '''Indexes of the values not written by the bulk update, not current if checked and
+        not found otherwise'''
+        failed = set()
+        for error in result.get('writeErrors', []):
+            if error['code'] != DUPLICATE_KEY_ERROR_CODE:
+                raise MongoUpdateException("Error updating objects: %s" % error)
+            failed.add(error['index'])  # Upsert of a not current value
+        if result['nMatched'] + result['nUpserted'] + len(failed) == len(ids):
+            return failed
+
+        # Some values didn't match, check which ones with one more query
+        upserted = {upsert['index'] for upsert in result.get('upserted', [])}
+        candidates = [index for index in xrange(len(ids))
+                      if index not in failed and index not in upserted]
+        txn_k = update_if_current.SERIAL_TXN_COUNTER_KEY
+        cursor = self.db[collection].find({'_id': {"$in": [ids[i] for i in candidates]}},
+                                          {txn_k: 1})
+        counters = {_hashable(doc['_id']): doc.get(txn_k) for doc in cursor}
+        for index in candidates:
+            key = _hashable(ids[index])
+            if key not in counters:
+                failed.add(index)
+            elif index in checked and counters[key] != checked[index]:
+                failed.add(index)
+        return failed
 
     def update_field(self, collection, obj_id, field_name, value):
         # TODO: Add update_if_current check?
@@ -0,0 +1,64 @@
+from biicode.server.utils.cache import cache_key
+from bson import BSON
+
+
+class PublishedCache(object):
+    '''Cache by ID of published cells or contents. They are written once and never modified
+    (a DEV publication deletes the old IDs). Two tiers: a process local LRUCache of
+    deserialized objects and an optional MemCachedCollection shared by all the processes.
+    Deletes purge the shared tier and the local tier of this process. The IDs of a rolled
+    back publication can be reused, so the local tiers of the other processes must have a
+    max_age to read those IDs again. The shared tier never expires'''
+
+    def __init__(self, deserializer, lru_cache, mc_collection=None):
+        '''deserializer: of the cached objects, ex: CellDeserializer(ID)
+        lru_cache: process local LRUCache, with max_age
+        mc_collection: MemCachedCollection or None'''
+        self.deserializer = deserializer
+        self.lru_cache = lru_cache
+        self.mc_collection = mc_collection
+
+    def get_multi(self, object_ids):
+        '''returns {ID: obj} of the cached ones'''
+        result = {}
+        missing = {}
+        for object_id in object_ids:
+            key = cache_key(object_id)
+            obj = self.lru_cache.get(key)
+            if obj is not None:
+                result[object_id] = obj
+            else:
+                missing[key] = object_id
+
+        if missing and self.mc_collection is not None:
+            docs = self.mc_collection.get_multi(missing.keys())
+            for key, doc in docs.iteritems():
+                obj = self.deserializer.deserialize(doc)
+                self.lru_cache.set(key, obj, self._size(doc))
+                result[missing[key]] = obj
+        return result
+
+    def set_multi(self, objs):
+        docs = {}
+        for obj in objs:
+            key = cache_key(obj.ID)
+            doc = obj.serialize()
+            self.lru_cache.set(key, obj, self._size(doc))
+            docs[key] = doc
+        if docs and self.mc_collection is not None:
+            self.mc_collection.set_multi(docs, 0)
+
+    def delete_multi(self, object_ids):
+        keys = [cache_key(object_id) for object_id in object_ids]
+        for key in keys:
+            self.lru_cache.delete(key)
+        if keys and self.mc_collection is not None:
+            self.mc_collection.delete_multi(keys)
+
+    def stats(self):
+        return self.lru_cache.stats()
+
+    @staticmethod
+    def _size(doc):
+        '''Approximated with the BSON document size'''
+        return len(BSON.encode(doc))
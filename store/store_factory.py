@@ -0,0 +1,59 @@
+from biicode.server.conf import BII_MONGO_URI, BII_MEMCACHE_SERVERS,\
+    BII_MEMCACHE_USERNAME, BII_MEMCACHE_PASSWORD, BII_MAX_MONGO_POOL_SIZE,\
+    BII_BLOCK_CACHE_MAX_BYTES, BII_PUBLISHED_CACHE_MAX_BYTES, BII_IMMUTABLE_CACHE_MAX_BYTES,\
+    BII_FIND_RESULT_CACHE_MAX_BYTES, BII_PUBLISHED_CACHE_MAX_AGE, BII_FIND_RESULT_CACHE_MAX_AGE
+from biicode.server.store.mongo_server_store import MongoServerStore
+from biicode.server.store.mongo_store import MongoStore
+from biicode.server.store.published_cache import PublishedCache
+from biicode.server.utils.cache import LRUCache, MemCachedCollection
+
+
+def build_store(connection=None, process_caches=True):
+    '''Server store, with the memcache proxy if memcache is configured. Everything writing
+    to the database must use it (server and scripts), so the cached elements are invalidated.
+    Params:
+        connection: MongoClient, by default a new one
+        process_caches: False for scripts, without the process local caches of the server'''
+    if BII_MEMCACHE_SERVERS:
+        import pylibmc
+        client = pylibmc.Client(servers=[BII_MEMCACHE_SERVERS],
+                                username=BII_MEMCACHE_USERNAME,
+                                password=BII_MEMCACHE_PASSWORD,
+                                binary=True)
+    else:
+        client = None
+
+    if connection is None:
+        connection = MongoStore.makeConnection(BII_MONGO_URI,
+                                               max_pool_size=BII_MAX_MONGO_POOL_SIZE)
+    if process_caches:
+        store = MongoServerStore(connection, **_process_caches(client))
+    else:
+        store = MongoServerStore(connection)
+
+    if client:
+        from biicode.server.store.memcache_proxy_store import MemCacheProxyStore
+        return MemCacheProxyStore(store, client)
+    return store
+
+
+def _process_caches(client):
+    '''MongoServerStore caches of the server, local to each process'''
+    block_cache = LRUCache(BII_BLOCK_CACHE_MAX_BYTES) if BII_BLOCK_CACHE_MAX_BYTES else None
+    immutable_cache = None
+    if BII_IMMUTABLE_CACHE_MAX_BYTES:
+        immutable_cache = LRUCache(BII_IMMUTABLE_CACHE_MAX_BYTES)
+    find_result_cache = None
+    if BII_FIND_RESULT_CACHE_MAX_BYTES:
+        find_result_cache = LRUCache(BII_FIND_RESULT_CACHE_MAX_BYTES,
+                                     BII_FIND_RESULT_CACHE_MAX_AGE)
+    published_caches = {}
+    if BII_PUBLISHED_CACHE_MAX_BYTES:
+        for collection in (MongoServerStore.PUBLISHED_CELL_ST,
+                           MongoServerStore.PUBLISHED_CONTENT_ST):
+            deserializer = MongoServerStore.deserializer[collection]
+            mc_collection = MemCachedCollection(client, collection) if client else None
+            lru_cache = LRUCache(BII_PUBLISHED_CACHE_MAX_BYTES, BII_PUBLISHED_CACHE_MAX_AGE)
+            published_caches[collection] = PublishedCache(deserializer, lru_cache, mc_collection)
+    return dict(block_cache=block_cache, published_caches=published_caches,
+                immutable_cache=immutable_cache, find_result_cache=find_result_cache)
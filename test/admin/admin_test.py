@@ -0,0 +1,25 @@
+import unittest
+from biicode.server.admin import admin
+from biicode.server.store.memcache_proxy_store import MemCacheProxyStore
+from biicode.server.test.store.mem_cache_client import MemCacheClient
+from biicode.test.testing_mem_server_store import TestingMemServerStore
+
+
+class AdminTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TestingMemServerStore()
+        self.proxy = MemCacheProxyStore(self.store, MemCacheClient())
+
+    def test_change_password_invalidates_cached_user(self):
+        admin.new_user(self.proxy, "timon", "timon@fake.com", "password1")
+        self.assertTrue(self.proxy.read_user("timon").valid_password("password1"))  # Cached
+
+        admin.change_password(self.proxy, "timon", "password2")
+        user = self.proxy.read_user("timon")
+        self.assertTrue(user.valid_password("password2"))
+        self.assertFalse(user.valid_password("password1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -52,6 +52,21 @@ class BiiApiTest(TestWithMongo):
         block_version = self.service.get_version_by_tag(brl_block, 'mytag')
         self.assertEquals(1, block_version.time)
 
+    def test_get_version_delta_info(self):
+        brl_block = BRLBlock('%s/%s/TestBlock/master' % (self.testUser.ID, self.testUser.ID))
+        publish_request = PublishRequest(BlockVersion(brl_block, -1))
+        publish_request.tag = STABLE
+        publish_request.msg = 'first'
+        publish_request.cells.append(SimpleCell(brl_block.block_name + 'r1.h'))
+        publish_request.deptable = BlockVersionTable()
+        self.service.publish(publish_request)
+
+        delta = self.service.get_version_delta_info(BlockVersion(brl_block, 0))
+        self.assertEqual('first', delta.msg)
+        self.assertIsNone(self.service.get_version_delta_info(BlockVersion(brl_block, -1)))
+        self.assertRaises(NotFoundException, self.service.get_version_delta_info,
+                          BlockVersion(brl_block, 1))
+
     def test_tag_nofound(self):
         brl_block = BRLBlock('%s/%s/TestBlock/master' % (self.testUser.ID, self.testUser.ID))
         with self.assertRaises(NotFoundException):
@@ -157,6 +157,18 @@ class AuthorizeTest(unittest.TestCase):
         self.store.upsert_block_permissions(bper)
         self.assertRaises(ForbiddenException, ensure.check_read_block, brl)
 
+    def test_filter_read_blocks(self):
+        private_brl = BRLBlock("goku/goku/block/private")
+        self.store.upsert_block_permissions(ElementPermissions(private_brl, private=True))
+        missing_brl = BRLBlock("goku/goku/block/missing")
+        brls = {self.public_brl, private_brl, missing_brl}
+
+        self.assertEqual({self.public_brl, private_brl},
+                         Security("goku", self.store).filter_read_blocks(brls))
+        self.assertEqual({self.public_brl},
+                         Security("bulma", self.store).filter_read_blocks(brls))
+        self.assertEqual({self.public_brl}, Security(None, self.store).filter_read_blocks(brls))
+
     def test_write_block(self):
         # 1. Onwer can write the block if its private
         brl = BRLBlock("goku/goku/block/master")
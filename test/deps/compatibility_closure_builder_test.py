@@ -194,6 +194,52 @@ class CompatibilityClosureBuilderTest(unittest.TestCase):
         expected_frontier[depA2].add('a.h')
         self.assertEqual(expected_frontier, closure.frontier)
 
+    def test_incremental_builds(self):
+        '''blockB and blockC depend on the same version of blockA. Closure is built first for
+        B and A, then for C and A, a.h is not fetched again'''
+        ref_translator = Mock()
+
+        depA = BlockVersion(BRLBlock('user/user/blockA/branch'), 4)
+        baseB = BlockVersion(BRLBlock('user/user/blockB/branch'), 2)
+        baseC = BlockVersion(BRLBlock('user/user/blockC/branch'), 3)
+
+        full_graph = BlockVersionGraph()
+        full_graph.add_nodes([baseB, baseC, depA])
+        full_graph.add_edge(baseB, depA)
+        full_graph.add_edge(baseC, depA)
+
+        fetched = []
+
+        def res_method(*args):
+            deps = [BlockCellName('user/blockA/a.h')]
+            result = ReferencedResources()
+            for ref in args[0].explode():
+                fetched.append(ref)
+                result[ref.block_version][ref.ref] = \
+                {Reference(depA, 'a.h'): ((0, 0), 0, []),
+                 Reference(baseB, 'b.h'): ((1, 4), 1, deps),
+                 Reference(baseC, 'c.h'): ((2, 3), 2, deps)}[ref]
+            return result
+
+        ref_translator.get_published_min_refs.side_effect = res_method
+
+        missing = References()
+        missing.add(Reference(baseB, 'b.h'))
+        missing.add(Reference(baseC, 'c.h'))
+        closure = CompatibilityClosure(missing)
+        build_compatibility_closure(ref_translator, closure, {baseB, depA}, full_graph)
+        self.assertEqual(2, closure.num_fetched)
+        build_compatibility_closure(ref_translator, closure, {baseC, depA}, full_graph)
+
+        self.assertEqual(References(), closure.broken)
+        self.assertEqual(References(), closure.frontier)
+        self.assertEqual({BlockCellName('user/blockA/a.h'),
+                          BlockCellName('user/blockB/b.h'),
+                          BlockCellName('user/blockC/c.h')}, closure.block_cell_names)
+        self.assertEqual(3, len(fetched))
+        self.assertEqual(3, closure.num_fetched)
+        self.assertEqual(1, closure.num_reused)
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.test_simple']
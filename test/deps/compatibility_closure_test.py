@@ -110,6 +110,16 @@ class CompatibilityClosureTest(unittest.TestCase):
         c2.add_item((cell_id2, content_id1),  cell_id1, v1, 'file1')
         self.assertEqual(1, c1.conflicts(c2))
         self.assertEqual(1, c2.conflicts(c1))
+        self.assertFalse(c1.is_compatible(c2))
+        self.assertFalse(c2.is_compatible(c1))
+
+        # Roots only in the bigger closure are not conflicts
+        c2.add_item((cell_id2, content_id1),  cell_id2, v1, 'file2')
+        self.assertEqual(1, c1.conflicts(c2))
+        self.assertEqual(1, c2.conflicts(c1))
+        c1.add_item((cell_id2, content_id1),  cell_id1, v0, 'file1')
+        self.assertTrue(c1.is_compatible(c2))
+        self.assertTrue(c2.is_compatible(c1))
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
@@ -0,0 +1,31 @@
+import unittest
+from biicode.server.find.cell_names_index import CellNamesIndex
+from biicode.common.model.brl.block_name import BlockName
+from biicode.common.model.brl.cell_name import CellName
+from biicode.common.model.brl.block_cell_name import BlockCellName
+from biicode.common.model.declare.cpp_declaration import CPPDeclaration
+
+
+class CellNamesIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        cell_names = [CellName("a.h"), CellName("src/b.h"), CellName("src/a.h")]
+        renames = {CellName("old.h"): CellName("src/b.h")}
+        self.index = CellNamesIndex(BlockName("user/block"), cell_names, renames)
+
+    def test_match(self):
+        self.assertEqual({BlockCellName("user/block/a.h")},
+                         self.index.match(CPPDeclaration("user/block/a.h")))
+        self.assertEqual({BlockCellName("user/block/src/a.h")},
+                         self.index.match(CPPDeclaration("user/block/src/a.h")))
+        self.assertEqual(set(), self.index.match(CPPDeclaration("user/block/c.h")))
+
+    def test_renames(self):
+        self.assertEqual({BlockCellName("user/block/src/b.h")},
+                         self.index.match(CPPDeclaration("user/block/old.h")))
+        self.assertEqual({BlockCellName("user/block/src/b.h")},
+                         self.index.match(CPPDeclaration("user/block/src/b.h")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
+import random
 import unittest
-from biicode.server.find.constraint_satisfaction import BaseCSPElem, CSPExact
+from biicode.server.find.constraint_satisfaction import BaseCSPElem, CSPExact,\
+    CompatibilityMatrix, IterDeep, SearchBudget
 from biicode.common.utils.bii_logging import logger
 
 
@@ -17,6 +19,20 @@ class CSPElem(BaseCSPElem):
         return '{0} '.format(self.value)
 
 
+class CountingCSPElem(CSPElem):
+    '''Compatible unless values are in conflicts set of pairs'''
+
+    def __init__(self, value, conflicts, checks):
+        CSPElem.__init__(self, value)
+        self.conflicts = conflicts
+        self.checks = checks
+
+    def is_compatible(self, other):
+        pair = frozenset([self.value, other.value])
+        self.checks[pair] = self.checks.get(pair, 0) + 1
+        return pair not in self.conflicts
+
+
 class CSPTest(unittest.TestCase):
     NVAR = 5
     NVAL = 5
@@ -59,6 +75,116 @@ class CSPTest(unittest.TestCase):
         logger.debug(solver)
         self.assertEqual(False, solFound)
 
+    def _counting_csp(self, conflicts, checks):
+        return [[CountingCSPElem((i, j), conflicts, checks) for j in range(CSPTest.NVAL)]
+                for i in range(CSPTest.NVAR)]
+
+    def testSolutionAndCompatibilityComputedOnce(self):
+        '''first values of each variable conflict, the solution needs backtracking'''
+        conflicts = set()
+        for i in range(CSPTest.NVAR - 1):
+            for j in range(CSPTest.NVAL - 1):
+                conflicts.add(frozenset([(i, j), (CSPTest.NVAR - 1, j)]))
+                conflicts.add(frozenset([(i, j), (i + 1, j + 1)]))
+        checks = {}
+        csp = self._counting_csp(conflicts, checks)
+        solver = CSPExact(csp, None)
+        self.assertTrue(solver.solveCSP())
+        solution = [elem.value for elem in solver.getCompatibleSol()]
+        self.assertEqual(range(CSPTest.NVAR), [var for var, _ in solution])
+        for elem in solution:
+            for other in solution:
+                self.assertNotIn(frozenset([elem, other]), conflicts)
+        self.assertEqual(1, max(checks.values()))
+
+        # Other solver sharing the matrix doesn't check again
+        checks.clear()
+        other = CSPExact(csp, None, solver.matrix)
+        self.assertTrue(other.solveCSP())
+        self.assertEqual({}, checks)
+
+    def testArcConsistency(self):
+        conflicts = {frozenset([(0, j), (1, k)]) for j in range(CSPTest.NVAL)
+                     for k in range(CSPTest.NVAL - 1)}
+        checks = {}
+        csp = self._counting_csp(conflicts, checks)
+        solver = CSPExact(csp, None, CompatibilityMatrix(csp))
+        solver.arcConsistencyCheckOn = True
+        self.assertTrue(solver.solveCSP())
+        self.assertIn(csp[1][CSPTest.NVAL - 1], solver.getCompatibleSol())
+
+    def testIncrementalIterDeep(self):
+        '''first two versions of last variable conflict with all the others'''
+        conflicts = set()
+        for i in range(CSPTest.NVAR - 1):
+            for j in range(CSPTest.NVAL):
+                conflicts.add(frozenset([(i, j), (CSPTest.NVAR - 1, 0)]))
+                conflicts.add(frozenset([(i, j), (CSPTest.NVAR - 1, 1)]))
+        checks = {}
+        iter_deep = IterDeep(self._counting_csp(conflicts, checks))
+        found, solution = iter_deep.start()
+        self.assertTrue(found)
+        self.assertEqual(3, iter_deep.num_iter)
+        self.assertEqual((CSPTest.NVAR - 1, 2), solution[-1].value)
+        for elem in solution:
+            for other in solution:
+                self.assertNotIn(frozenset([elem.value, other.value]), conflicts)
+        # Compatibility results are reused by the next iterations
+        self.assertEqual(1, max(checks.values()))
+
+        # Without solution, all the iterations
+        conflicts.update(frozenset([(0, j), (CSPTest.NVAR - 1, k)])
+                         for j in range(CSPTest.NVAL) for k in range(CSPTest.NVAL))
+        checks.clear()
+        iter_deep = IterDeep(self._counting_csp(conflicts, checks))
+        self.assertEqual((False, None), iter_deep.start())
+        self.assertEqual(CSPTest.NVAL, iter_deep.num_iter)
+        self.assertEqual(1, max(checks.values()))
+
+    def testIterDeepSameSolutionAsFullSearch(self):
+        '''each iteration finds the solution a full search of the iteration csp finds'''
+        rand = random.Random(7)
+        elems = [(i, j) for i in range(CSPTest.NVAR) for j in range(CSPTest.NVAL)]
+        for _ in range(50):
+            conflicts = {frozenset(rand.sample(elems, 2)) for _ in range(20)}
+            # Baseline: a new solver for all the values of each iteration
+            expected = None
+            for num_values in range(1, CSPTest.NVAL + 1):
+                csp = [row[:num_values] for row in self._counting_csp(conflicts, {})]
+                solver = CSPExact(csp, None)
+                if solver.solveCSP():
+                    expected = [elem.value for elem in solver.getCompatibleSol()]
+                    break
+            iter_deep = IterDeep(self._counting_csp(conflicts, {}))
+            found, solution = iter_deep.start()
+            self.assertEqual(expected is not None, found)
+            if found:
+                self.assertEqual(expected, [elem.value for elem in solution])
+                self.assertEqual(num_values, iter_deep.num_iter)
+
+    def testSearchBudget(self):
+        '''without solution, the search is stopped by the budget returning the best partial
+        solution, with a compatible value for all but the last variable'''
+        conflicts = {frozenset([(CSPTest.NVAR - 2, j), (CSPTest.NVAR - 1, k)])
+                     for j in range(CSPTest.NVAL) for k in range(CSPTest.NVAL)}
+        csp = self._counting_csp(conflicts, {})
+        self.assertEqual((False, None), IterDeep(csp).start())
+
+        budget = SearchBudget(max_steps=10)
+        iter_deep = IterDeep(self._counting_csp(conflicts, {}), budget=budget)
+        found, partial = iter_deep.start()
+        self.assertFalse(found)
+        self.assertEqual(SearchBudget.STEPS, iter_deep.budget_exhausted)
+        self.assertEqual(11, budget.steps)
+        self.assertEqual(range(CSPTest.NVAR - 1), [elem.value[0] for elem in partial])
+
+        # Time limit
+        budget = SearchBudget(max_seconds=0)
+        budget.deadline -= 1
+        found, partial = IterDeep(self._counting_csp(conflicts, {}), budget=budget).start()
+        self.assertFalse(found)
+        self.assertEqual(SearchBudget.TIME, budget.exhausted)
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'CSPTest.testName']
     unittest.main()
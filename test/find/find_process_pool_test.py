@@ -0,0 +1,58 @@
+from biicode.server.test.find.finder_test import BaseFinderTest
+from biicode.server.find.find_process_pool import FindProcessPool, _read_bytes
+from biicode.server.test.publisher import TestPublisher
+from biicode.common.model.brl.brl_block import BRLBlock
+from biicode.common.model.brl.block_cell_name import BlockCellName
+from biicode.common.api.ui import BiiResponse
+from biicode.common.exception import BiiException
+import unittest
+
+
+class FindProcessPoolTest(BaseFinderTest):
+
+    def test_find_in_process(self):
+        brl_a = BRLBlock('%s/%s/%s/master' % (self.user, self.user, 'blocka'))
+        name_a = BlockCellName(self.user + "/blocka/a.h")
+        TestPublisher(self.user, self.store).publish(brl_a, {'a.h': ('a', [])})
+
+        # The processes are forked with the published block in their store
+        pool = FindProcessPool(2, lambda: self.store)
+        try:
+            for _ in range(3):
+                result = pool.find(self.user, self.build_unresolved_request(name_a),
+                                   BiiResponse())
+                self.check_result(result, resolved=[(brl_a, 0, {name_a})])
+        finally:
+            pool.close()
+
+    def test_replace_ended_process(self):
+        def failing_store():
+            raise ValueError("No store")
+        pool = FindProcessPool(1, failing_store)
+        try:
+            process, _ = pool._idle.peek()
+            request = self.build_unresolved_request(self.user + "/blocka/a.h")
+            with self.assertRaises(BiiException):
+                pool.find(self.user, request, BiiResponse())
+            new_process, _ = pool._idle.peek()
+            self.assertNotEqual(process.pid, new_process.pid)
+            self.assertFalse(process.is_alive())
+        finally:
+            pool.close()
+
+    def test_read_bytes(self):
+        data = "pumba" * 10
+        reads = []
+
+        def read(fd, size):  # At most 7 bytes each time
+            chunk = data[len("".join(reads)):][:min(size, 7)]
+            reads.append(chunk)
+            return chunk
+        self.assertEqual(data, _read_bytes(None, len(data), read))
+        del reads[:]
+        data = "timon"
+        self.assertRaises(EOFError, _read_bytes, None, 10, read)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,6 +13,10 @@ from biicode.common.find.policy import Policy
 from biicode.server.test.publisher import TestPublisher
 from biicode.common.api.ui import BiiResponse
 import time
+from biicode.server.find.finder_service import FindService, RecordedOutput
+from biicode.common.exception import NotInStoreException
+from biicode.server.utils.cache import LRUCache
+from mock import patch
 
 
 class BaseFinderTest(unittest.TestCase):
@@ -83,6 +87,22 @@ class FinderTest(BaseFinderTest):
             result = self.service.find(request, BiiResponse())
             self.check_result(result, resolved=[(brl_a, i, {name_a})])
 
+    def test_blocks_read_through_store(self):
+        '''find reads the blocks with the read_block of the store, once per request'''
+        brl_a = BRLBlock('%s/%s/%s/master' % (self.user, self.user, 'blocka'))
+        name_a = BlockCellName(self.user + "/blocka/a.h")
+        publisher = TestPublisher(self.user, self.store)
+        publisher.publish(brl_a, {'a.h': ('a', [])})
+        publisher.publish(brl_a, {'a.h': ('a', [])})
+
+        with patch.object(self.store, 'read_block', wraps=self.store.read_block) as read_block:
+            request = self.build_unresolved_request(name_a)
+            result = self.service.find(request, BiiResponse())
+            self.check_result(result, resolved=[(brl_a, 1, {name_a})])
+            whole_reads = [args for args, _ in read_block.call_args_list
+                           if args[0] == brl_a and args[1] is None]
+            self.assertEqual(1, len(whole_reads))
+
     def test_simple_update(self):
         '''Test finding updates in a simple block with 1 file with no more dependencies '''
         brl_a = BRLBlock('%s/%s/%s/master' % (self.user, self.user, 'blocka'))
@@ -177,6 +197,102 @@ class FinderTest(BaseFinderTest):
         self.check_result(result, unresolved=request.unresolved)
 
 
+class StubHypothesis(object):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.computed = 0
+
+    @property
+    def block_closure(self):
+        self.computed += 1
+        if self.fail:
+            raise NotInStoreException("Not found")
+        return {}
+
+
+class PrecomputeClosuresTest(unittest.TestCase):
+
+    def test_precompute_closures(self):
+        hypothesis = [[StubHypothesis(), StubHypothesis()], [StubHypothesis(True)]]
+        FindService(TestingMemServerStore(), None)._precompute_closures(hypothesis)
+        self.assertEqual([[1, 1], [1]], [[hyp.computed for hyp in row] for row in hypothesis])
+
+
+class StubVersionHypothesis(object):
+    def __init__(self, brl, time, conflicts):
+        self.block_version = BlockVersion(brl, time)
+        self.conflicts = conflicts
+
+    def is_compatible(self, other):
+        return frozenset([self.block_version, other.block_version]) not in self.conflicts
+
+
+class CompatiblePartialTest(unittest.TestCase):
+
+    def test_existing_dependencies(self):
+        '''a partial solution updating b, but not c, must be compatible with current c'''
+        brl_a, brl_b, brl_c = [BRLBlock('user/user/block%s/master' % name) for name in 'abc']
+        conflicts = {frozenset([BlockVersion(brl_b, 2), BlockVersion(brl_c, 0)])}
+        a1, b2, b1, c1, c0 = [StubVersionHypothesis(brl, time, conflicts) for brl, time
+                              in ((brl_a, 1), (brl_b, 2), (brl_b, 1), (brl_c, 1), (brl_c, 0))]
+        hypothesis = [[a1], [b2, b1], [c1, c0]]
+        request = FinderRequest()
+        request.existing = ReferencedDependencies()
+        for version in (b1.block_version, c0.block_version):
+            request.existing[version][CPPDeclaration("dep.h")].add(BlockCellName("user/dep.h"))
+
+        # b2 is discarded, so current b1 is kept, and a1 is compatible with it
+        self.assertEqual([a1], FindService._compatible_partial([a1, b2], hypothesis, request))
+
+        # Otherwise a1 is discarded too
+        conflicts.add(frozenset([a1.block_version, b1.block_version]))
+        self.assertEqual([], FindService._compatible_partial([a1, b2], hypothesis, request))
+
+        # Without existing dependencies out of the partial solution, all of it
+        self.assertEqual([a1, b2, c1],
+                         FindService._compatible_partial([a1, b2, c1], hypothesis, request))
+
+
+class FindResultCacheTest(BaseFinderTest):
+
+    def test_cached_result(self):
+        self.store.find_result_cache = LRUCache(10e6)
+        brl_a = BRLBlock('%s/%s/%s/master' % (self.user, self.user, 'blocka'))
+        name_a = BlockCellName(self.user + "/blocka/a.h")
+        publisher = TestPublisher(self.user, self.store)
+        publisher.publish(brl_a, {'a.h': ('a', [])})
+
+        request = self.build_unresolved_request(name_a)
+        output = RecordedOutput()
+        result = self.service.find(request, output)
+        self.check_result(result, resolved=[(brl_a, 0, {name_a})])
+        result.resolved.clear()  # Doesn't modify the cached one
+        with patch.object(FindService, '_find') as find:
+            cached_output = RecordedOutput()
+            result = self.service.find(self.build_unresolved_request(name_a), cached_output)
+            self.assertFalse(find.called)
+        self.check_result(result, resolved=[(brl_a, 0, {name_a})])
+        self.assertEqual(output.messages, cached_output.messages)
+
+        # Expired results are computed again, permissions could have changed
+        cache = self.store.find_result_cache = LRUCache(10e6, 60)
+        with patch("biicode.server.utils.cache.time.time", return_value=1000):
+            self.service.find(request, BiiResponse())
+        with patch("biicode.server.utils.cache.time.time", return_value=1059):
+            self.service.find(request, BiiResponse())
+            self.assertEqual(1, cache.hits)
+        with patch("biicode.server.utils.cache.time.time", return_value=1061):
+            result = self.service.find(request, BiiResponse())
+            self.assertEqual((1, 2), (cache.hits, cache.misses))
+        self.check_result(result, resolved=[(brl_a, 0, {name_a})])
+
+        # A new publication changes the counter of the candidate block
+        publisher.publish(brl_a, {'a.h': ('a', [])})
+        with patch.object(self.store, 'read_block_change_counters', return_value={brl_a: 1}):
+            result = self.service.find(request, BiiResponse())
+        self.check_result(result, resolved=[(brl_a, 1, {name_a})])
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
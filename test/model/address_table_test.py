@@ -1,8 +1,29 @@
+import sys
 import unittest
 from time import time
+from nose.plugins.attrib import attr
 
-from biicode.server.model.address_table import AddressTable
+from biicode.server.model.address_table import AddressTable, _Snapshots
+from biicode.server.model.time_base_map import TimeBaseMap, IDTimeBaseMap
 from biicode.common.model.id import ID, UserID
+from biicode.common.utils.bii_logging import logger
+
+
+def _list_map_bytes(time_map):
+    '''bytes of a TimeBaseMap of IDs, with its lists, times and IDs'''
+    times, items = time_map
+    result = sys.getsizeof(time_map) + sys.getsizeof(times) + sys.getsizeof(items)
+    result += sum(sys.getsizeof(time_) for time_ in times)
+    for id_ in items:
+        result += sys.getsizeof(id_) + sum(sys.getsizeof(value) for value in id_)
+    return result
+
+
+def _compact_map_bytes(time_map):
+    result = sys.getsizeof(time_map) + sys.getsizeof(time_map.times)
+    result += sys.getsizeof(time_map.packed) + sys.getsizeof(time_map.foreign)
+    return result + sum(_list_map_bytes(TimeBaseMap(([], [id_])))
+                        for id_ in time_map.foreign)
 
 
 class AddressTableTest(unittest.TestCase):
@@ -38,6 +59,104 @@ class AddressTableTest(unittest.TestCase):
         avg_time = (time() - t) / (size * r)
         self.assertLess(avg_time, 60e-6)  # less than 30 microseconds
 
+    @attr('performance')
+    def test_memory(self):
+        num_cells = 1000
+        num_versions = 10
+        table = AddressTable(self.block_id)
+        list_maps = {}
+        for version in range(num_versions):
+            for cell in range(num_cells):
+                name = "cell%d.h" % cell
+                table.create(name, self.block_id + (version * num_cells + cell), version)
+                list_maps.setdefault(name, TimeBaseMap()).append(version, table.last(name)[1])
+
+        list_bytes = sum(_list_map_bytes(time_map) for time_map in list_maps.itervalues())
+        compact_bytes = sum(_compact_map_bytes(time_map) for time_map in table.itervalues())
+        logger.info("AddressTable of %d cells x %d versions: lists %d bytes, arrays %d bytes"
+                    % (num_cells, num_versions, list_bytes, compact_bytes))
+        self.assertLess(compact_bytes * 4, list_bytes)
+
+    def test_foreign_ids(self):
+        foreign_id = UserID(5) + 6 + 7
+        table = AddressTable(self.block_id)
+        table.create("r1", self.block_id + 123, 0)
+        table.create("r1", foreign_id, 1)
+        table.delete("r1", 2)
+        self.assertIsInstance(table["r1"], IDTimeBaseMap)
+        self.assertEqual(self.block_id + 123, table.get_id("r1", 0))
+        self.assertEqual(foreign_id, table.get_id("r1", 1))
+        self.assertEqual(None, table.get_id("r1", 2))
+        self.assertEqual({self.block_id + 123}, table.all_ids())
+        self.assertEqual([foreign_id, None], list(table["r1"].xrange(1, 3)))
+
+        self.assertEqual(None, table.pop_dev("r1", 2))
+        self.assertEqual(foreign_id, table.pop_dev("r1", 1))
+        self.assertEqual([], table["r1"].foreign)
+        self.assertEqual((0, ID((123, ))), table.last("r1"))
+
+    def _searched_ids(self, table, time):
+        '''get_all_ids searching every name, without checkpoints'''
+        result = {}
+        for name in table:
+            id_ = table.get_id(name, time)
+            if id_ is not None:
+                result[name] = id_
+        return result
+
+    def test_snapshots(self):
+        table = AddressTable(self.block_id)
+        foreign_id = UserID(5) + 6 + 7
+        for version in range(0, 100, 2):  # Versions without changes too
+            for cell in range(version % 7, 20, 3):
+                name = "r%d" % cell
+                if (cell + version) % 5 == 0 and name in table:
+                    table.delete(name, version)
+                elif cell == 4:
+                    table.create(name, foreign_id, version)
+                else:
+                    table.create(name, self.block_id + (version * 100 + cell), version)
+        for time in [-1, 0, 1, 17, 32, 33, 64, 97, 98, 200, 5, 50]:
+            self.assertEqual(self._searched_ids(table, time), table.get_all_ids(time))
+
+        # Snapshots are returned as a copy, and built again after changes
+        table.get_all_ids(98)["r1"] = None
+        table.create("new", self.block_id + 1, 98)
+        table.delete("r2", 98)
+        self.assertEqual(self._searched_ids(table, 98), table.get_all_ids(98))
+        self.assertEqual(self.block_id + 1, table.get_all_ids(98)["new"])
+        self.assertNotIn("r2", table.get_all_ids(98))
+        self.assertNotIn("new", table.get_all_ids(97))
+
+        # Few checkpoints kept, any order of times gives the same snapshots
+        snapshots = _Snapshots(table, 2, 3)
+        for time in [97, 3, 50, 98, 10, 60, 0, 33, 97, -1, 40]:
+            self.assertEqual(self._searched_ids(table, time), snapshots.get(time))
+            self.assertLessEqual(len(snapshots._checkpoints), 3)
+
+    @attr('performance')
+    def test_snapshots_speed(self):
+        num_cells = 2000
+        num_versions = 100
+        table = AddressTable(self.block_id)
+        for cell in range(num_cells):
+            table.create("cell%d.h" % cell, self.block_id + cell, 0)
+        for version in range(1, num_versions):
+            table.create("cell%d.h" % version, self.block_id + (num_cells + version), version)
+
+        table.get_all_ids(num_versions - 1)  # Changes and checkpoints are built once
+        t = time()
+        for version in range(num_versions):
+            table.get_all_ids(version)
+        snapshots_time = time() - t
+        t = time()
+        for version in range(num_versions):
+            self._searched_ids(table, version)
+        searched_time = time() - t
+        logger.info("Snapshots of %d cells x %d versions: checkpoints %.4fs, search %.4fs"
+                    % (num_cells, num_versions, snapshots_time, searched_time))
+        self.assertLess(snapshots_time, searched_time)
+
     def test_remove(self):
         table = AddressTable(self.block_id)
 
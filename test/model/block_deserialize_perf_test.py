@@ -0,0 +1,76 @@
+import unittest
+import time
+from nose.plugins.attrib import attr
+from biicode.server.model.block import Block
+from biicode.common.model.id import ID
+from biicode.common.model.brl.brl_block import BRLBlock
+from biicode.common.model.brl.cell_name import CellName
+from biicode.common.model.block_delta import BlockDelta
+from biicode.common.model.symbolic.block_version import BlockVersion
+from biicode.common.model.symbolic.block_version_table import BlockVersionTable
+from biicode.common.model.version_tag import STABLE
+from biicode.common.utils.bii_logging import logger
+
+
+def make_block_doc(num_versions, num_cells=100):
+    '''serialized block with num_versions versions, each one modifying one cell and
+    its content and changing the dependency table'''
+    block_id = ID((1, 2))
+    block = Block(block_id, BRLBlock('user/user/block/master'))
+    for version in xrange(num_versions):
+        block.deltas.append(BlockDelta('msg %d' % version, STABLE, date=version))
+        name = CellName('cell%d.h' % (version % num_cells))
+        block.cells.create(name, block_id + version, version)
+        block.contents.create(name, block_id + version, version)
+        dep = BlockVersion(BRLBlock('user/user/dep/master'), version)
+        block.dep_tables.append(version, BlockVersionTable([dep]))
+    return block.serialize()
+
+
+class BlockDeserializePerfTest(unittest.TestCase):
+
+    def _time(self, func, reps=10):
+        start = time.time()
+        for _ in xrange(reps):
+            func()
+        return (time.time() - start) / reps
+
+    def _check_lazy_deserialize(self, num_versions):
+        doc = make_block_doc(num_versions)
+
+        def eager():
+            # Previous behaviour, every table was deserialized
+            block = Block.deserialize(doc)
+            block.cells, block.contents, block.dep_tables, block.deltas
+            block.get_renames(0, 0)
+
+        def lazy():
+            # Most readers only use one table, as get_dep_table
+            Block.deserialize(doc).dep_tables
+
+        eager_time = self._time(eager)
+        lazy_time = self._time(lazy)
+        logger.info("Block deserialize with %d versions: all tables %.4fs, one table %.4fs"
+                    % (num_versions, eager_time, lazy_time))
+        self.assertLess(lazy_time, eager_time)
+
+    def test_lazy_tables(self):
+        doc = make_block_doc(10)
+        block = Block.deserialize(doc)
+        self.assertEqual(doc[Block.SERIAL_DELTAS], block._raw[Block.SERIAL_DELTAS])
+        self.assertEqual(10, len(block.deltas))
+        self.assertNotIn(Block.SERIAL_DELTAS, block._raw)
+        self.assertIn(Block.SERIAL_CELL_TABLE, block._raw)
+        self.assertEqual(doc, block.serialize())
+
+    @attr('performance')
+    def test_deserialize_1k_versions(self):
+        self._check_lazy_deserialize(1000)
+
+    @attr('performance')
+    def test_deserialize_10k_versions(self):
+        self._check_lazy_deserialize(10000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import random
+import unittest
+from heapq import heappush
+from biicode.server.model.versions_index import VersionsIndex
+from biicode.common.model.block_delta import BlockDelta
+from biicode.common.model.version_tag import STABLE, DEV
+
+
+class VersionsIndexTest(unittest.TestCase):
+
+    def _index(self, dates):
+        return VersionsIndex([BlockDelta('msg', DEV if num % 2 else STABLE, date=date)
+                              for num, date in enumerate(dates)])
+
+    def test_newest(self):
+        index = self._index([10, 20, 20, 30])
+        self.assertEqual([3, 2, 1, 0], [num for num, _, _ in index.newest()])
+        self.assertEqual([(3, DEV, 30), (2, STABLE, 20)], list(index.newest(min_date=15))[:2])
+        self.assertEqual([3], [num for num, _, _ in index.newest(min_date=20)])
+        self.assertEqual([], list(index.newest(min_date=30)))
+
+    def test_unsorted_dates(self):
+        index = self._index([10, 30, 20, 25])
+        self.assertEqual([1, 3, 2, 0], [num for num, _, _ in index.newest()])
+        self.assertEqual([1, 3], [num for num, _, _ in index.newest(min_date=20)])
+
+    def _heap_order(self, dates):
+        '''order of the list that _filter_by_policy returned before, a heap of the versions
+        iterated as a list'''
+        heap = []
+        for num in range(len(dates) - 1, -1, -1):
+            heappush(heap, ((-dates[num], -num), num))
+        return [num for _, num in heap]
+
+    def test_same_order_as_heap_with_sorted_dates(self):
+        rand = random.Random(3)
+        for _ in range(20):
+            dates = sorted(rand.randint(0, 10) for _ in range(rand.randint(0, 20)))
+            self.assertEqual(self._heap_order(dates),
+                             [num for num, _, _ in self._index(dates).newest()])
+
+    def test_unsorted_dates_order_differs_from_heap(self):
+        '''the heap list was not sorted when dates were not, now versions are always newest
+        first'''
+        dates = [10, 30, 20, 25]
+        self.assertEqual([1, 2, 3, 0], self._heap_order(dates))
+        self.assertEqual([1, 3, 2, 0], [num for num, _, _ in self._index(dates).newest()])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -34,7 +34,7 @@ class PublishServiceTest(unittest.TestCase):
 
         block = Mock(Block)
         block.add_publication.return_value = (Mock(), Mock())
-        store.read_block.return_value = block
+        store.read_block_for_update.return_value = block
         brl = BRLBlock('user/user/block/branch')
 
         p = PublishService(store, 'authUser')
@@ -65,7 +65,7 @@ class PublishServiceTest(unittest.TestCase):
         ensure.check_write_block = Mock(return_value=True)
         ensure.check_read_block = Mock(return_value=True)
 
-        store.read_block.return_value = block
+        store.read_block_for_update.return_value = block
         store.read_published_cells.return_value = {}
         p = PublishService(store, 'authUser')
         p.security = ensure
@@ -83,6 +83,7 @@ class PublishServiceTest(unittest.TestCase):
         block.add_publication.assert_called_once_with(pack, p.auth_user)
         store.update_block.assert_called_once_with(block)
         self.assertEqual(1, store.create_published_cells.call_count)
+        self.assertEqual(1, store.upsert_published_min_cells.call_count)
         self.assertEqual(1, store.create_published_contents.call_count)
 
         # Check sizes
@@ -137,7 +138,7 @@ class PublishServiceTest(unittest.TestCase):
         ensure.check_write_block = Mock(return_value=True)
         ensure.check_publish_block = Mock(return_value=True)
 
-        store.read_block.return_value = block
+        store.read_block_for_update.return_value = block
         store.read_published_cells.return_value = {}
         p = PublishService(store, 'authUser')
         p.security = ensure
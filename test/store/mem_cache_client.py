@@ -17,6 +17,28 @@ class MemCacheClient:
         self.write_counter += 1
         self.elements[key] = value
 
+    def add(self, key, value, time=None):
+        if key in self.elements:
+            return False
+        self.write_counter += 1
+        self.elements[key] = value
+        return True
+
     def get(self, key):
         self.read_counter += 1
         return self.elements[key]
+
+    def get_multi(self, keys):
+        self.read_counter += 1
+        return {key: self.elements[key] for key in keys if key in self.elements}
+
+    def set_multi(self, mapping, time=None):
+        self.write_counter += 1
+        self.elements.update(mapping)
+        return []
+
+    def delete_multi(self, keys):
+        self.delete_counter += 1
+        for key in keys:
+            self.elements.pop(key, None)
+        return True
@@ -10,6 +10,17 @@ from biicode.test.testing_mem_server_store import TestingMemServerStore
 from biicode.server.test.store.mongo_test import TestWithMongo
 from nose_parameterized.parameterized import parameterized
 from biicode.server.store.mongo_server_store import MongoServerStore
+from biicode.server.store.mem_server_store import MemServerStore
+from biicode.server.reference_translator.reference_translator_service import \
+    ReferenceTranslatorService
+from biicode.common.model.symbolic.block_version import BlockVersion
+from biicode.common.model.symbolic.reference import References
+from biicode.common.model.brl.cell_name import CellName
+from biicode.common.model.symbolic.block_version_table import BlockVersionTable
+from mock import patch, Mock
+from biicode.server.utils.cache import LRUCache
+from biicode.server.conf import BII_IMMUTABLE_CACHE_IDS_MAX_AGE
+import unittest
 
 
 class MemServerStoreTest(TestWithMongo):
@@ -34,3 +45,118 @@ class MemServerStoreTest(TestWithMongo):
 
         self.assertEquals(first[0], "bonjovi/bonjovi/itsmylife/master")
         self.assertEquals(first[1].__class__, datetime.datetime)
+
+
+class MemServerStoreReadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TestingMemServerStore()
+        self.references = References()
+        for i in range(3):
+            brl = BRLBlock("bonjovi/bonjovi/block%d/master" % i)
+            block = Block(ID((23, i)), brl)
+            ppack = PublishRequest(block.last_version())
+            r1 = SimpleCell('bonjovi/block%d/r1.h' % i)
+            ppack.cells.append(r1)
+            ppack.contents['r1.h'] = Content(id_=None, load=Blob('hola'))
+            ppack.deptable = BlockVersionTable()
+            block.add_publication(ppack)
+            r1.root = r1.ID
+            self.store.create_block(block, False)
+            self.store.create_published_cells([r1])
+            self.references[BlockVersion(brl, 0)].add(CellName('r1.h'))
+
+    def test_published_min_refs_batched(self):
+        store = self.store
+        translator = ReferenceTranslatorService(MemServerStore(store), "bonjovi")
+        with patch.object(store, 'read_blocks', wraps=store.read_blocks) as read_blocks:
+            with patch.object(store, 'read_published_cells',
+                              wraps=store.read_published_cells) as read_cells:
+                min_refs = translator.get_published_min_refs(self.references)
+                self.assertEqual(3, len(min_refs))
+                self.assertEqual(1, read_blocks.call_count)
+                self.assertEqual(1, read_cells.call_count)
+
+                # Next waves reuse the request blocks and min cells
+                translator.get_published_min_refs(self.references)
+                self.assertEqual(1, read_blocks.call_count)
+                self.assertEqual(1, read_cells.call_count)
+
+    def test_read_block(self):
+        brl = BRLBlock("bonjovi/bonjovi/block0/master")
+        mem_store = MemServerStore(self.store)
+        with patch.object(self.store, 'read_block', wraps=self.store.read_block) as read_block:
+            deltas = mem_store.read_block(brl, [Block.SERIAL_DELTAS])
+            self.assertIs(deltas, mem_store.read_block(brl, [Block.SERIAL_DELTAS]))
+            read_block.assert_called_once_with(brl, [Block.SERIAL_DELTAS], None)
+
+            # Other tables, then the whole block, that serves any tables
+            mem_store.read_block(brl, [Block.SERIAL_RENAMES], 3)
+            block = mem_store.read_block(brl)
+            self.assertIs(block, mem_store.read_block(brl, [Block.SERIAL_DELTAS]))
+            self.assertIs(block, mem_store.read_block(brl))
+            self.assertEqual(3, read_block.call_count)
+            read_block.assert_called_with(brl, None, None)
+
+    def test_shared_immutable_cache(self):
+        self.store.immutable_cache = LRUCache(10e6)
+        cell_id = ID((23, 0, 0))
+        version = BlockVersion(BRLBlock("bonjovi/bonjovi/block0/master"), 0)
+        MemServerStore(self.store).read_min_cells([cell_id])
+        MemServerStore(self.store).read_dep_table(version)
+
+        # Other request
+        with patch.object(self.store, 'read_published_min_cells') as read_min_cells:
+            with patch.object(self.store, 'read_dep_table') as read_dep_table:
+                mem_store = MemServerStore(self.store)
+                self.assertEqual({cell_id: (cell_id, [])}, mem_store.read_min_cells([cell_id]))
+                self.assertEqual(BlockVersionTable(), mem_store.read_dep_table(version))
+                self.assertFalse(read_min_cells.called)
+                self.assertFalse(read_dep_table.called)
+
+                # Published again, counter changed
+                with patch.object(self.store, 'read_block_change_counter', return_value=1):
+                    MemServerStore(self.store).read_dep_table(version)
+                    # The counter is passed, not read again by the block cache
+                    read_dep_table.assert_called_once_with(version, 1)
+
+    def test_shared_min_cells_expire(self):
+        '''IDs of a rolled back publication are used again, shared min cells expire'''
+        self.store.immutable_cache = LRUCache(10e6)
+        cell_id = ID((23, 0, 0))
+        with patch("biicode.server.utils.cache.time.time", return_value=1000):
+            MemServerStore(self.store).read_min_cells([cell_id])
+        with patch.object(self.store, 'read_published_min_cells',
+                          wraps=self.store.read_published_min_cells) as read_min_cells:
+            with patch("biicode.server.utils.cache.time.time", return_value=1001):
+                MemServerStore(self.store).read_min_cells([cell_id])
+                self.assertFalse(read_min_cells.called)
+            with patch("biicode.server.utils.cache.time.time",
+                       return_value=1001 + BII_IMMUTABLE_CACHE_IDS_MAX_AGE):
+                MemServerStore(self.store).read_min_cells([cell_id])
+                self.assertTrue(read_min_cells.called)
+
+    def test_shared_block_closure(self):
+        self.store.immutable_cache = LRUCache(10e6)
+        version = BlockVersion(BRLBlock("bonjovi/bonjovi/block0/master"), 0)
+
+        def build(mem_store):
+            mem_store.read_dep_table(version)
+            return Mock(nodes=[version], neighbours=Mock(return_value=[]))
+
+        mem_store = MemServerStore(self.store)
+        graph = mem_store.read_block_closure(version, lambda: build(mem_store))
+
+        # Other request, gets the counters of the closure
+        build_method = Mock()
+        other_store = MemServerStore(self.store)
+        self.assertIs(graph, other_store.read_block_closure(version, build_method))
+        self.assertFalse(build_method.called)
+        self.assertEqual(mem_store.block_counters, other_store.block_counters)
+        self.assertIn(version.block, other_store.block_counters)
+
+        # Published again (DEV), counter changed
+        with patch.object(self.store, 'read_block_change_counters',
+                          return_value={version.block: 1}):
+            MemServerStore(self.store).read_block_closure(version, build_method)
+            self.assertTrue(build_method.called)
@@ -0,0 +1,62 @@
+import copy
+import unittest
+from mock import patch
+from biicode.server.store.memcache_proxy_store import MemCacheProxyStore
+from biicode.server.test.store.mem_cache_client import MemCacheClient
+from biicode.test.testing_mem_server_store import TestingMemServerStore
+from biicode.server.model.user import User
+from biicode.server.model.block import Block
+from biicode.common.model.brl.brl_block import BRLBlock
+from biicode.common.model.id import ID
+
+
+class MemCacheProxyStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TestingMemServerStore()
+        self.client = MemCacheClient()
+        self.proxy = MemCacheProxyStore(self.store, self.client)
+        self.user = User("dummy")
+        self.proxy.create_user(self.user)
+
+    def test_read_through(self):
+        with patch.object(self.store, 'read_user', wraps=self.store.read_user) as read_user:
+            self.assertEqual(self.user, self.proxy.read_user("dummy"))
+            self.assertEqual(self.user, self.proxy.read_user("dummy"))
+            self.assertEqual(1, read_user.call_count)
+
+    def test_write_invalidates(self):
+        user = self.proxy.read_user("dummy")
+        user.active = True
+        self.proxy.update_user(user)
+        with patch.object(self.store, 'read_user', wraps=self.store.read_user) as read_user:
+            self.assertTrue(self.proxy.read_user("dummy").active)
+            self.assertEqual(1, read_user.call_count)
+
+    def test_write_during_read(self):
+        read_user = self.store.read_user
+
+        def read_and_write(brl_user):
+            old = copy.deepcopy(read_user(brl_user))
+            user = read_user(brl_user)
+            user.active = True
+            self.proxy.update_user(user)  # Invalidates before the read caches the old user
+            return old
+
+        with patch.object(self.store, 'read_user', side_effect=read_and_write):
+            self.proxy.read_user("dummy")
+        self.assertTrue(self.proxy.read_user("dummy").active)
+
+    def test_block_permissions(self):
+        brl = BRLBlock("dummy/dummy/block/master")
+        self.proxy.create_block(Block(ID((1, 1)), brl), private=True)
+        self.assertTrue(self.proxy.read_block_permissions(brl).is_private)
+
+        permissions = self.store.read_block_permissions(brl)
+        permissions.is_private = False
+        self.proxy.update_block_permissions(permissions)
+        self.assertFalse(self.proxy.read_block_permissions(brl).is_private)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,9 +2,13 @@ from nose.core import run
 from mongo_test import TestWithMongo
 from biicode.server.exception import (BiiPendingTransactionException,
                                       MongoNotCurrentObjectException, MongoStoreException,
-                                      MongoNotFoundUpdatingException)
+                                      MongoNotFoundUpdatingException,
+                                      MongoBulkUpdateException)
 from biicode.server.store.mongo_server_store import MongoServerStore
 from biicode.server.model.block import Block
+from biicode.server.model.user import User
+from biicode.common.model.brl.brl_user import BRLUser
+from biicode.server.model.min_cell import MinCell
 from biicode.common.model.brl.brl_block import BRLBlock
 from db_model_creator import ModelCreator
 from biicode.common.test import model_creator
@@ -17,9 +21,16 @@ from biicode.server.test.store.mongo_test import MONGODB_TEST_PORT
 from biicode.common.model.renames import Renames
 from biicode.server.store.generic_server_store import GenericServerStore
 from biicode.server.model.permissions.element_permissions import ElementPermissions
-from biicode.common.exception import AlreadyInStoreException
+from biicode.common.exception import AlreadyInStoreException, BiiStoreException
 from biicode.common.model.id import ID
 from biicode.common.model.brl.block_cell_name import BlockCellName
+from biicode.common.publish.publish_request import PublishRequest
+from biicode.common.model.symbolic.block_version import BlockVersion
+from biicode.common.model.cells import SimpleCell
+from biicode.common.model.version_tag import STABLE
+from biicode.server.utils.cache import LRUCache, MemCachedCollection
+from biicode.server.store.published_cache import PublishedCache
+from biicode.server.test.store.mem_cache_client import MemCacheClient
 
 
 class MongoStoreTest(TestWithMongo):
@@ -50,6 +61,105 @@ class MongoStoreTest(TestWithMongo):
         retrieved1 = self.store.read_block(name)
         self.assertEqual(block, retrieved1)
 
+    def test_read_partial_block(self):
+        name = BRLBlock('%s/%s/PartialBlock/master' % (self.user.ID, self.user.ID))
+        block = Block(self.user.add_block(name), name)
+        publish_request = PublishRequest(BlockVersion(name, -1))
+        publish_request.cells.append(SimpleCell(name.block_name + 'r1.h'))
+        publish_request.tag = STABLE
+        block.add_publication(publish_request)
+        self.store.create_block(block)
+
+        partial = self.store.read_block(name, [Block.SERIAL_DELTAS])
+        self.assertTrue(partial.partial)
+        self.assertEqual(block.deltas, partial.deltas)
+        self.assertEqual(block.last_version(), partial.last_version())
+        with self.assertRaises(BiiStoreException):
+            partial.cells
+        with self.assertRaises(BiiStoreException):
+            self.store.update_block(partial)
+
+        self.assertEqual(block.deltas[0], self.store.read_block_delta(name, 0))
+        self.assertIsNone(self.store.read_block_delta(name, 1))
+        self.assertIsNone(self.store.read_block_delta(name, -1))
+
+    def test_block_cache(self):
+        store = MongoServerStore(self.conn, self.__class__.__name__, block_cache=LRUCache(10e6))
+        name = BRLBlock('%s/%s/CachedBlock/master' % (self.user.ID, self.user.ID))
+        block = Block(self.user.add_block(name), name)
+        store.create_block(block)
+
+        self.assertEqual(block, store.read_block(name))
+        cached = store.read_block(name)
+        self.assertEqual(1, store.block_cache.hits)
+        with self.assertRaises(BiiStoreException):  # Shared with other requests
+            cached.add_publication(PublishRequest(BlockVersion(name, -1)))
+
+        # Projections are cached too
+        partial = store.read_block(name, [Block.SERIAL_DELTAS])
+        self.assertTrue(partial.partial)
+        self.assertIs(partial, store.read_block(name, [Block.SERIAL_DELTAS]))
+        self.assertEqual(2, store.block_cache.hits)
+
+        # Changes from other process, only the counter is shared
+        publish_request = PublishRequest(BlockVersion(name, -1))
+        publish_request.cells.append(SimpleCell(name.block_name + 'r1.h'))
+        publish_request.tag = STABLE
+        block.add_publication(publish_request)
+        self.store.update_block(block)
+        self.store.bump_block_change_counter(name)
+
+        self.assertEqual(block, store.read_block(name))
+        self.assertEqual(block.deltas, store.read_block(name, [Block.SERIAL_DELTAS]).deltas)
+        self.assertEqual(4, store.block_cache.misses)
+        self.assertEqual({"block": store.block_cache.stats()}, store.cache_stats())
+
+    def test_read_blocks(self):
+        names = [BRLBlock('%s/%s/Multi%d/master' % (self.user.ID, self.user.ID, i))
+                 for i in range(3)]
+        blocks = {name: Block(self.user.add_block(name), name) for name in names}
+        for block in blocks.itervalues():
+            self.store.create_block(block)
+        missing = BRLBlock('%s/%s/Missing/master' % (self.user.ID, self.user.ID))
+
+        self.assertEqual(blocks, self.store.read_blocks(names + [missing]))
+        partial = self.store.read_blocks(names, [Block.SERIAL_CELL_TABLE])
+        self.assertTrue(all(block.partial for block in partial.itervalues()))
+
+        store = MongoServerStore(self.conn, self.__class__.__name__, block_cache=LRUCache(10e6))
+        self.assertEqual(blocks, store.read_blocks(names))
+        self.assertEqual(blocks, store.read_blocks(names))
+        partial = store.read_blocks(names, [Block.SERIAL_CELL_TABLE])
+        self.assertEqual(partial, store.read_blocks(names, [Block.SERIAL_CELL_TABLE]))
+        self.assertEqual(6, store.block_cache.hits)
+
+    def test_published_cache(self):
+        collection = GenericServerStore.PUBLISHED_CELL_ST
+        mc_collection = MemCachedCollection(MemCacheClient(), collection)
+        cache = PublishedCache(MongoServerStore.deserializer[collection], LRUCache(10e6),
+                               mc_collection)
+        store = MongoServerStore(self.conn, self.__class__.__name__,
+                                 published_caches={collection: cache})
+        block = self.mother.make_block()
+        cell = model_creator.make_published_resource(block, 'TestUser/geom/cached.cpp')
+        store.create_published_cells([cell])
+
+        self.assertEqual({cell.ID: cell}, store.read_published_cells([cell.ID]))
+        self.assertEqual({cell.ID: cell}, store.read_published_cells([cell.ID]))
+        self.assertEqual(1, cache.lru_cache.hits)
+
+        # Other process, only memcached is shared
+        cache2 = PublishedCache(MongoServerStore.deserializer[collection], LRUCache(10e6),
+                                mc_collection)
+        self.assertEqual({cell.ID: cell}, cache2.get_multi([cell.ID]))
+
+        # Rollback deletes serialized IDs, purges both tiers
+        store.delete_multi([cell.ID.serialize()], collection)
+        self.assertEqual({}, cache.get_multi([cell.ID]))
+        self.assertEqual({}, cache2.get_multi([cell.ID]))
+        self.assertEqual({}, store.read_published_cells([cell.ID]))
+        self.assertIn(collection, store.cache_stats())
+
     def test_insert_read_published_resource(self):
         block = self.mother.make_block()
         resource = model_creator.make_published_resource(block, 'TestUser/geom/sphere.cpp')
@@ -58,6 +168,18 @@ class MongoStoreTest(TestWithMongo):
         self.assertEqual(resource, retrieved[resource.ID])
         self.assertEqual(1, len(retrieved))
 
+    def test_published_min_cells(self):
+        block = self.mother.make_block()
+        cell = model_creator.make_published_resource(block, 'TestUser/geom/min.cpp')
+        self.store.upsert_published_min_cells([cell])
+        self.store.upsert_published_min_cells([cell])  # Reused IDs after rollback
+        retrieved = self.store.read_published_min_cells([cell.ID])
+        self.assertEqual(MinCell.from_cell(cell), retrieved[cell.ID])
+        self.assertEqual((cell.root, list(cell.dependencies.targets)), retrieved[cell.ID].value)
+
+        self.store.delete_published_min_cells([cell.ID])
+        self.assertEqual({}, self.store.read_published_min_cells([cell.ID]))
+
     def test_insert_read_published_content(self):
         block = self.mother.make_block(self.user)
         brl = BlockCellName('%s/geom/sphere.cpp' % block.ID.owner)
@@ -83,10 +205,45 @@ class MongoStoreTest(TestWithMongo):
         self.store.update_user(u_)  # Now b1_bis is dirty!! is not updated from database
         self.assertRaises(MongoNotCurrentObjectException, self.store.update_user, u1_bis)
 
+    def test_update_multi_reports_failed(self):
+        self._check_update_multi_reports_failed()
+
+    def test_update_multi_without_bulk_operations(self):
+        with mock.patch.object(self.store, '_has_bulk_operations', return_value=False):
+            self._check_update_multi_reports_failed()
+
+    def _check_update_multi_reports_failed(self):
+        u1 = self.mother.make_test_user()
+        u2 = self.mother.make_test_user()
+        u1_bis = self.store.read_user(u1.ID)
+        self.store.update_user(self.store.read_user(u1.ID))  # Now u1_bis is dirty
+        u2.active = False
+        missing = User(BRLUser('NotExistingUser'))
+
+        with self.assertRaises(MongoBulkUpdateException) as cm:
+            self.store.update_multi([u1_bis, u2, missing], GenericServerStore.USER_ST)
+        self.assertEqual([u1.ID], cm.exception.not_current_ids)
+        self.assertEqual([missing.ID], cm.exception.not_found_ids)
+        self.assertIsInstance(cm.exception, MongoNotCurrentObjectException)  # For safe_retry
+        self.assertFalse(self.store.read_user(u2.ID).active)  # The others are written
+
+        with self.assertRaises(MongoNotFoundUpdatingException):
+            self.store.update_multi([missing], GenericServerStore.USER_ST)
+
+        # Upserting a not current value neither writes it
+        with self.assertRaises(MongoBulkUpdateException) as cm:
+            self.store.upsert_multi([u1_bis], GenericServerStore.USER_ST)
+        self.assertEqual([u1.ID], cm.exception.not_current_ids)
+
     def test_txn_multiple_updates_same_object(self):
         for _ in range(10):
             # Not dirty!! same memory object with up to date counter
             self.store.update_user(self.user)
+        # Also in one update_multi, in order
+        self.user.active = True
+        self.store.update_multi([self.user] * 10, GenericServerStore.USER_ST)
+        self.assertTrue(self.store.read_user(self.user.ID).active)
+        self.store.update_user(self.user)
 
     def test_txn_limit_counter(self):
         bclean = self.store.read_user(self.user.ID)
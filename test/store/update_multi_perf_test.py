@@ -0,0 +1,38 @@
+import time
+from nose.plugins.attrib import attr
+from biicode.server.test.store.mongo_test import TestWithMongo
+from biicode.server.store.mongo_server_store import MongoServerStore
+from biicode.server.store.generic_server_store import GenericServerStore
+from biicode.server.model.permissions.element_permissions import ElementPermissions
+from biicode.common.model.brl.brl_block import BRLBlock
+from biicode.common.utils.bii_logging import logger
+
+
+class UpdateMultiPerfTest(TestWithMongo):
+
+    def setUp(self):
+        self.store = MongoServerStore(self.conn, self.__class__.__name__)
+
+    @attr('performance')
+    def test_update_multi_1k(self):
+        collection = GenericServerStore.BLOCK_PERMISSIONS_ST
+        permissions = [ElementPermissions(BRLBlock("user/user/block%d/master" % i))
+                       for i in xrange(1000)]
+        self.store.create_multi(permissions, collection)
+        for perm in permissions:
+            perm.read.grant("friend")
+
+        start = time.time()
+        for perm in permissions:  # Previous behaviour
+            self.store.update(perm, collection)
+        loop_time = time.time() - start
+
+        start = time.time()
+        self.store.update_multi(permissions, collection)
+        bulk_time = time.time() - start
+
+        logger.info("update_multi of 1000 documents: loop %.4fs, bulk %.4fs"
+                    % (loop_time, bulk_time))
+        self.assertLess(bulk_time, loop_time)
+        self.assertTrue(self.store.read_block_permissions(permissions[-1].ID)
+                        .read.is_granted("friend"))
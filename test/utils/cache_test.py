@@ -1,8 +1,8 @@
 import unittest
 from datetime import timedelta
-from biicode.server.utils.cache import MemCachedCollection
+from biicode.server.utils.cache import MemCachedCollection, LRUCache, canonical
 from biicode.test.fake_mem_store import FakeMemStore
-from mock import Mock
+from mock import Mock, patch
 
 
 class Test(unittest.TestCase):
@@ -30,3 +30,63 @@ class Test(unittest.TestCase):
         self.mem.set = Mock()
         self.cache.set("timon2", "pumba2")
         self.mem.set.assert_called_once_with("animals@timon2", "pumba2", time=0)
+
+
+class LRUCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(max_bytes=10)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("timon"))
+        self.cache.set("timon", "pumba", 5)
+        self.assertEqual(self.cache.get("timon"), "pumba")
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_evict_least_recently_used(self):
+        self.cache.set("timon", "pumba", 4)
+        self.cache.set("simba", "nala", 4)
+        self.cache.get("timon")
+        self.cache.set("scar", "mufasa", 4)
+        self.assertIsNone(self.cache.get("simba"))
+        self.assertEqual(self.cache.get("timon"), "pumba")
+        self.assertEqual(self.cache.get("scar"), "mufasa")
+        self.assertEqual(1, self.cache.evictions)
+        self.assertEqual(8, self.cache.stats()["bytes"])
+
+    def test_too_big_element(self):
+        self.cache.set("timon", "pumba", 11)
+        self.assertIsNone(self.cache.get("timon"))
+        self.assertEqual(0, self.cache.stats()["bytes"])
+
+    def test_max_age(self):
+        cache = LRUCache(max_bytes=10, max_age=60)
+        with patch("biicode.server.utils.cache.time.time", return_value=1000):
+            cache.set("timon", "pumba", 4)
+        with patch("biicode.server.utils.cache.time.time", return_value=1059):
+            self.assertEqual(cache.get("timon"), "pumba")
+        with patch("biicode.server.utils.cache.time.time", return_value=1061):
+            self.assertIsNone(cache.get("timon"))
+        self.assertEqual(0, cache.stats()["bytes"])
+
+    def test_element_max_age(self):
+        with patch("biicode.server.utils.cache.time.time", return_value=1000):
+            self.cache.set("timon", "pumba", 4, max_age=60)
+            self.cache.set("simba", "nala", 4)
+        with patch("biicode.server.utils.cache.time.time", return_value=1061):
+            self.assertIsNone(self.cache.get("timon"))
+            self.assertEqual(self.cache.get("simba"), "nala")
+
+    def test_version(self):
+        self.cache.set("timon", "pumba", 4, version=1)
+        self.assertEqual(self.cache.get("timon", 1), "pumba")
+        self.assertIsNone(self.cache.get("timon", 2))
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(0, self.cache.stats()["bytes"])
+
+
+class CanonicalTest(unittest.TestCase):
+    def test_canonical(self):
+        self.assertEqual(canonical({"timon": [1, 2], "pumba": {"a": 1, "b": 2}}),
+                         canonical({"pumba": {"b": 2, "a": 1}, "timon": [1, 2]}))
+        # Order of the rules of a policy matters
+        self.assertNotEqual(canonical({"rules": [1, 2]}), canonical({"rules": [2, 1]}))
@@ -0,0 +1,30 @@
+import unittest
+from biicode.server.utils.intern import InternTable
+from biicode.common.model.brl.cell_name import CellName
+from biicode.common.model.brl.brl_user import BRLUser
+
+
+class InternTableTest(unittest.TestCase):
+
+    def test_intern(self):
+        table = InternTable(2)
+        name = CellName("a.h")
+        self.assertIs(name, table.intern(name))
+        self.assertIs(name, table.intern(CellName("a.h")))
+
+        # Equal values of other classes are not mixed
+        user = table.intern(BRLUser("a.h"))
+        self.assertIsInstance(user, BRLUser)
+        self.assertEqual({"CellName": 1, "BRLUser": 1}, table.stats())
+
+    def test_max_size(self):
+        table = InternTable(2)
+        first = table.intern(CellName("a.h"))
+        table.intern(CellName("b.h"))
+        table.intern(CellName("c.h"))  # Table full, cleared
+        self.assertEqual({"CellName": 1}, table.stats())
+        self.assertIsNot(first, table.intern(CellName("a.h")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,26 @@
+import time
+from collections import OrderedDict
 from biicode.common.utils.bii_logging import logger
 
 
+def cache_key(object_id):
+    '''String key for BRLs (strings) and IDs (sequences of ints, also serialized)'''
+    if isinstance(object_id, basestring):
+        return str(object_id)
+    return "-".join(str(i) for i in object_id)
+
+
+def canonical(data):
+    '''Hashable form of serialized data that doesn't depend on the order of dicts.
+    Sequences keep their order, it can be meaningful (policy rules). Serialized sets keep
+    their iteration order, equal sets with different orders only give different forms'''
+    if isinstance(data, dict):
+        return tuple(sorted((canonical(k), canonical(v)) for k, v in data.iteritems()))
+    if isinstance(data, (list, tuple)):
+        return tuple(canonical(element) for element in data)
+    return data
+
+
 class MemCachedCollection(object):
 
     def __init__(self, mc, collection_name):
@@ -29,6 +49,101 @@ class MemCachedCollection(object):
         key = self._construct_key(key)
         return self.mc.delete(key)
 
+    def add(self, key, value, expire_seconds=0):
+        '''Sets the value only if key is not stored. Returns True if it was set'''
+        key = self._construct_key(key)
+        try:
+            return bool(self.mc.add(key, value, time=int(expire_seconds)))
+        except Exception as exc:
+            logger.error(exc)
+            return False
+
+    def get_multi(self, keys):
+        '''Returns a dict {key: value} with the found keys'''
+        mc_keys = {self._construct_key(key): key for key in keys}
+        try:
+            found = self.mc.get_multi(mc_keys.keys())
+        except Exception as exc:
+            logger.error(exc)
+            return {}
+        return {mc_keys[mc_key]: value for mc_key, value in found.iteritems()}
+
+    def set_multi(self, mapping, expire_seconds=0):
+        mc_mapping = {self._construct_key(key): value for key, value in mapping.iteritems()}
+        try:
+            return self.mc.set_multi(mc_mapping, time=int(expire_seconds))
+        except Exception as exc:
+            logger.error(exc)
+            return None
+
+    def delete_multi(self, keys):
+        try:
+            return self.mc.delete_multi([self._construct_key(key) for key in keys])
+        except Exception as exc:
+            logger.error(exc)
+            return None
+
     def _construct_key(self, key):
         key = self.collection_name + "@" + key
         return key
+
+
+class LRUCache(object):
+    '''Process local LRU cache, bounded by the total size in bytes of its elements.
+    Elements can be stored with a version, a get with other version is a miss and discards it.
+    With max_age, of the cache or of some elements, elements older than max_age seconds are
+    misses too.
+    Not thread safe, intended for gevent workers'''
+
+    def __init__(self, max_bytes, max_age=None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._elements = OrderedDict()  # {key: (version, value, size, expiration)}, oldest first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version=None):
+        try:
+            element = self._elements.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        if element[0] != version or (element[3] is not None and element[3] < time.time()):
+            self._bytes -= element[2]  # Stale, forget it
+            self.misses += 1
+            return None
+        self._elements[key] = element  # Most recently used
+        self.hits += 1
+        return element[1]
+
+    def set(self, key, value, size, version=None, max_age=None):
+        '''max_age: of this element, instead of the max_age of the cache'''
+        self.delete(key)
+        if size > self.max_bytes:
+            return
+        max_age = max_age if max_age is not None else self.max_age
+        expiration = time.time() + max_age if max_age is not None else None
+        self._elements[key] = (version, value, size, expiration)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, old_size, _) = self._elements.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+
+    def delete(self, key):
+        element = self._elements.pop(key, None)
+        if element is not None:
+            self._bytes -= element[2]
+
+    def __len__(self):
+        return len(self._elements)
+
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "elements": len(self._elements),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes}
@@ -0,0 +1,35 @@
+from biicode.server.conf import BII_INTERN_MAX_SIZE
+
+
+class InternTable(object):
+    '''Canonical objects of equal immutable values (names, versions, IDs), so the ones
+    deserialized or built many times share one object: less memory, and dict and set
+    lookups of shared objects are resolved by identity.
+    There is a table for each class, as names of different kinds can be equal strings.
+    Names and versions are str and tuple subclasses, they can't be weakly referenced,
+    so tables keep them and are cleared when they reach max_size.
+    Not thread safe, intended for gevent workers'''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._tables = {}  # {class: {value: value}}
+
+    def intern(self, value):
+        '''returns the canonical object equal to value, value itself the first time'''
+        table = self._tables.get(value.__class__)
+        if table is None:
+            table = self._tables[value.__class__] = {}
+        try:
+            return table[value]
+        except KeyError:
+            if len(table) >= self.max_size:
+                table.clear()
+            table[value] = value
+            return value
+
+    def stats(self):
+        return {kls.__name__: len(table) for kls, table in self._tables.iteritems()}
+
+
+# Shared by the store deserializers and the services of the process
+names = InternTable(BII_INTERN_MAX_SIZE)